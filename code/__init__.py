@@ -1,11 +1,37 @@
-from flask import Flask
+def create_app():
+    '''导入 code 的子模块（如 code.utils）时不加载 Flask，首次访问 code.app 时才创建
+    '''
+    from flask import Flask
 
+    from .api import api
+    from .config import is_sweeping
+    from .database import session
+    from .sweeper import Sweeper
+    from .utils import cache
 
-app = Flask(__name__)
+    app = Flask(__name__)
+    cache.warm()
+    if is_sweeping:
+        app.extensions['sweeper'] = Sweeper()
+        app.extensions['sweeper'].start()
 
-@app.route('/')
-def index():
-    return 'hello world'
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        session.remove()
+
+    @app.route('/')
+    def index():
+        return 'hello world'
+
+    app.register_blueprint(api)
+    return app
+
+def __getattr__(name):
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
@@ -0,0 +1,270 @@
+'''JSON HTTP API
+
+Example:
+    GET  /api/stations
+    GET  /api/stations/complete?q=bjx&limit=5
+    GET  /api/trains?from=利川&to=深圳北&depart_time=08:00&until_time=12:00&sort=duration
+    GET  /api/transfers?from=成都东&to=深圳北&depart_time=08:00&cursor=...
+    GET  /api/transfers?from=成都东&to=深圳北&format=ndjson
+    GET  /api/earliest?from=成都东&to=深圳北&depart_time=08:00&transfers=2
+    GET  /api/trains/D2/remaining?carriage_index=1&date=2020-05-20
+    POST /api/orders                       (HTTP Basic：身份证号、密码)
+    POST /api/orders/<id>/payment          (HTTP Basic：身份证号、密码)
+'''
+__all__ = ('api', )
+
+
+import base64
+import itertools
+import json
+
+from datetime import date, time
+
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+from werkzeug.exceptions import HTTPException
+
+try:
+    from .config import autocomplete_limit, max_page_size, max_transfers, page_size, query_cache_ttl
+    from .database import Order, session, status
+    from .timetable import Timetable, sorts
+    from .utils import add, check, get
+except:
+    from config import autocomplete_limit, max_page_size, max_transfers, page_size, query_cache_ttl
+    from database import Order, session, status
+    from timetable import Timetable, sorts
+    from utils import add, check, get
+
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+
+@api.errorhandler(HTTPException)
+def _http_error(error):
+    response = jsonify(error=error.description)
+    response.status_code = error.code
+    if error.code == 401:
+        response.headers['WWW-Authenticate'] = 'Basic realm="12306"'
+    return response
+
+
+@api.errorhandler(AssertionError)
+def _conflict(error):
+    session.rollback()
+    response = jsonify(error=str(error) or 'request rejected')
+    response.status_code = 409
+    return response
+
+
+def _static(data):
+    '''静态列表：带 ETag，If-None-Match 命中时返回 304
+    '''
+    response = jsonify(data)
+    response.cache_control.public = True
+    response.cache_control.max_age = query_cache_ttl
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _argument(name, type=str, required=True):
+    value = request.args.get(name)
+    if value is None:
+        if required:
+            abort(400, f'missing argument: {name}')
+        return None
+    try:
+        return type(value)
+    except ValueError:
+        abort(400, f'invalid argument: {name}={value}')
+
+
+def _sort(default):
+    sort = request.args.get('sort', default)
+    if sort not in sorts:
+        abort(400, f'sort must be one of {sorts}')
+    return sort
+
+
+def _cursor(value, sort):
+    '''游标为 [sort, *timetable.sort_key]，排序方式不同或格式不对时 ValueError
+    '''
+    data = json.loads(base64.urlsafe_b64decode(value.encode()).decode())
+    types = (str, int, int, str, str)
+    if not (isinstance(data, list) and len(data)==len(types) and data[0]==sort
+            and all(type(x) is t for x, t in zip(data, types))):
+        raise ValueError(value)
+    return tuple(data[1:])
+
+
+def _next_cursor(itinerary, sort):
+    key = Timetable.sort_key(itinerary, sort)
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    return iter(lambda: list(itertools.islice(iterator, size)), list())
+
+
+def _user():
+    auth = request.authorization
+    if auth is None or not auth.username:
+        abort(401, 'authentication required')
+    user = get.user(auth.username)
+    if user is None or not check.user_password(auth.username, auth.password or ''):
+        abort(401, 'invalid id card number or password')
+    return user
+
+
+def _itineraries(itineraries):
+    '''
+    Note:
+        - 时间为相对出发日 0 点的分钟数
+        - 每程附带各座位类型的票价（一次批量计算）
+    '''
+    itineraries = list(itineraries)
+    fares = iter(get.fares(
+        (leg.train_number, leg.from_station, leg.to_station)
+        for itinerary in itineraries for leg in itinerary.legs
+    ))
+    return [
+        dict(
+            legs=[dict(leg._asdict(), fares=next(fares)) for leg in itinerary.legs],
+            depart=itinerary.depart, arrive=itinerary.arrive, duration=itinerary.duration,
+        )
+        for itinerary in itineraries
+    ]
+
+
+def _order(order):
+    return dict(
+        id=order.id, status=status(order.status).name, price=order.price, user_id=order.user_id,
+        train_number=order.train_number, carriage_index=order.carriage_index,
+        seat_num=order.seat_num, depart_date=order.depart_date.isoformat(),
+        create_date=order.create_date.isoformat(),
+    )
+
+
+@api.route('/stations')
+def stations():
+    return _static(get.stations())
+
+
+@api.route('/stations/complete')
+def complete_stations():
+    limit = min(_argument('limit', int, False) or autocomplete_limit, max_page_size)
+    return jsonify(get.station_completions(_argument('q'), limit))
+
+
+@api.route('/cities')
+def cities():
+    return _static(get.cities())
+
+
+@api.route('/provinces')
+def provinces():
+    return _static(get.provinces())
+
+
+@api.route('/train-numbers')
+def train_numbers():
+    return _static(get.train_numbers())
+
+
+@api.route('/trains')
+def trains():
+    itineraries = get.itineraries_by_stations(
+        _argument('from'), _argument('to', required=False),
+        _argument('depart_time', time.fromisoformat, False),
+        _argument('until_time', time.fromisoformat, False), _sort('depart'),
+    )
+    return jsonify(_itineraries(itineraries))
+
+
+@api.route('/trains/<train_number>/remaining')
+def remaining(train_number):
+    number = get.remaining_tickets_number(
+        train_number, _argument('carriage_index', int), _argument('date', date.fromisoformat),
+        _argument('from', required=False), _argument('to', required=False),
+    )
+    if number is None:
+        abort(404, f'no such train or segment: {train_number}')
+    return jsonify(train_number=train_number, remaining=number)
+
+
+@api.route('/transfers')
+def transfers():
+    '''换乘查询
+
+    Note:
+        - 默认按游标（键集）分页：游标为上一页最后一个行程的排序关键字，只保留其后的前 size 个行程
+        - format=ndjson 时按顺序逐个生成并流式输出，limit 为行程总数，默认输出全部行程
+    '''
+    from_station, to_station = _argument('from'), _argument('to')
+    depart_time = _argument('depart_time', time.fromisoformat, False)
+    until_time = _argument('until_time', time.fromisoformat, False)
+    min_connection = _argument('min_connection', int, False)
+    sort = _sort('arrive')
+    if request.args.get('format') == 'ndjson':
+        itineraries = get.train_numbers_by_stations_transfer(
+            from_station, to_station, depart_time, min_connection,
+            _argument('limit', int, False), until_time, sort, iter=True,
+        )
+        lines = (
+            json.dumps(item, ensure_ascii=False)+'\n'
+            for chunk in _chunks(itineraries, page_size) for item in _itineraries(chunk)
+        )
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    size = min(_argument('size', int, False) or page_size, max_page_size)
+    try:
+        after = _cursor(request.args['cursor'], sort) if 'cursor' in request.args else None
+    except ValueError:
+        abort(400, 'invalid cursor')
+    page = get.train_numbers_by_stations_transfer(
+        from_station, to_station, depart_time, min_connection, size+1, until_time, sort, after,
+    )
+    return jsonify(
+        items=_itineraries(page[:size]),
+        next_cursor=_next_cursor(page[size-1], sort) if len(page)>size else None,
+    )
+
+
+@api.route('/earliest')
+def earliest():
+    '''最早到达：每个换乘次数（不超过 transfers）下比更少换乘到得更早的行程
+    '''
+    transfers = _argument('transfers', int, False)
+    itineraries = get.earliest_itineraries(
+        _argument('from'), _argument('to'), _argument('depart_time', time.fromisoformat, False),
+        _argument('min_connection', int, False), min(2 if transfers is None else transfers, max_transfers),
+    )
+    return jsonify(_itineraries(itineraries))
+
+
+@api.route('/orders', methods=('POST', ))
+def create_order():
+    user = _user()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, 'expected a JSON object')
+    try:
+        order = add.order(
+            user.id, body['train_number'], int(body['carriage_index']), body.get('seat_num'),
+            date.fromisoformat(body['depart_date']), body['depart_station'], body['arrive_station'],
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        abort(400, f'invalid order: {e!r}')
+    response = jsonify(_order(order))
+    response.status_code = 201
+    return response
+
+
+@api.route('/orders/<int:id>/payment', methods=('POST', ))
+def pay_order(id):
+    user = _user()
+    order = get._by(Order, id=id)
+    if order is None or order.user_id != user.id:
+        abort(404, f'no such order: {id}')
+    ticket = add.ticket(id=id)
+    response = jsonify(ticket_id=ticket.id, order=_order(get._by(Order, id=id)))
+    response.status_code = 201
+    return response
@@ -0,0 +1,148 @@
+'''order、ticket 分区维护：预建未来的月分区，分离并归档已过出发日期的月分区
+
+Example:
+    python -m code.archive
+    python -m code.archive --export data/archive/
+    python -m code.archive --dry-run
+
+Note:
+    - 需要先执行 data/partition.sql
+    - 归档的分区移到 archive 模式下，删除外键及二级索引后 vacuum full；
+      指定 export 时导出为 gzip 压缩的 COPY 文件后删除
+'''
+__all__ = ('partitions', 'archive', 'ensure')
+
+
+import argparse
+import gzip
+import os
+import re
+
+from datetime import date, timedelta
+
+try:
+    from .config import archive_after_days, partition_ahead_days
+    from .database import get_engine
+except:
+    from config import archive_after_days, partition_ahead_days
+    from database import get_engine
+
+
+_bound = re.compile(r"FOR VALUES FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def partitions(cursor, table):
+    '''
+    Return:
+        - list[tuple[str, datetime.date, datetime.date]], (分区名, 起始, 结束)，按起始排序，不含 default
+    '''
+    cursor.execute('''
+        select c.relname, pg_get_expr(c.relpartbound, c.oid) from pg_inherits as i
+        join pg_class as c on c.oid = i.inhrelid
+        where i.inhparent = %s::regclass
+    ''', (f'"{table}"', ))
+    result = list()
+    for name, bound in cursor.fetchall():
+        match = _bound.match(bound)
+        if match is not None:
+            result.append((name, *map(date.fromisoformat, match.groups())))
+    return sorted(result, key=lambda x: x[1])
+
+
+def ensure(days=None):
+    '''预建从今天到 days 天后的月分区
+
+    Return:
+        - int, 新建的分区数
+    '''
+    days = partition_ahead_days if days is None else days
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('select create_partitions(current_date, current_date + %s)', (days, ))
+        created, = cursor.fetchone()
+        connection.commit()
+    finally:
+        connection.close()
+    return created
+
+
+def archive(before=None, export=None, dry_run=False):
+    '''归档结束日期不晚于 before 的月分区（ticket 先于 order 分离）
+
+    Argument:
+        - before: NoneType or datetime.date, 默认 archive_after_days 天前，不晚于今天
+        - export: NoneType or str, 导出目录
+        - dry_run: bool
+    Return:
+        - list[str], 归档的 order 分区名
+    '''
+    before = min(before or date.today()-timedelta(days=archive_after_days), date.today())
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        tickets = {lower: name for name, lower, _ in partitions(cursor, 'ticket')}
+        names = [
+            (name, tickets.get(lower)) for name, lower, upper in partitions(cursor, 'order')
+            if upper <= before
+        ]
+        if dry_run:
+            return [name for name, _ in names]
+        cursor.execute('create schema if not exists archive')
+        for order, ticket in names:
+            for table, partition in (('ticket', ticket), ('order', order)):
+                if partition is None:
+                    continue
+                cursor.execute(f'alter table "{table}" detach partition "{partition}"')
+                _compact(cursor, partition)
+                if export is None:
+                    cursor.execute(f'alter table "{partition}" set schema archive')
+                else:
+                    path = os.path.join(export, f'{partition}.copy.gz')
+                    with gzip.open(path, 'wb') as f:
+                        cursor.copy_expert(f'copy "{partition}" to stdout', f)
+                    cursor.execute(f'drop table "{partition}"')
+            connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    if export is None:
+        # vacuum 不能在事务中执行
+        connection = get_engine().connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            for name in (n for pair in names for n in pair if n is not None):
+                connection.execute(f'vacuum full archive."{name}"')
+        finally:
+            connection.close()
+    return [name for name, _ in names]
+
+
+def _compact(cursor, table):
+    '''删除分离后的分区上的外键及主键以外的索引
+    '''
+    cursor.execute('''
+        select conname from pg_constraint where conrelid = %s::regclass and contype = 'f'
+    ''', (f'"{table}"', ))
+    for name, in cursor.fetchall():
+        cursor.execute(f'alter table "{table}" drop constraint "{name}"')
+    cursor.execute('''
+        select i.relname from pg_index as x join pg_class as i on i.oid = x.indexrelid
+        where x.indrelid = %s::regclass and not x.indisprimary
+    ''', (f'"{table}"', ))
+    for name, in cursor.fetchall():
+        cursor.execute(f'drop index "{name}"')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='预建并归档 order、ticket 分区')
+    parser.add_argument('--before', type=date.fromisoformat, default=None, help='归档在此日期前结束的分区')
+    parser.add_argument('--export', default=None, help='导出为 gzip 压缩的 COPY 文件并删除分区')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    if args.export is not None:
+        os.makedirs(args.export, exist_ok=True)
+    if not args.dry_run:
+        print(f'{ensure()} partitions created')
+    print(f'archived: {archive(args.before, args.export, args.dry_run)}')
@@ -0,0 +1,108 @@
+__all__ = ('Autocomplete', 'autocomplete')
+
+
+import bisect
+
+try:
+    from .config import autocomplete_limit
+    from .database import Station, session
+except:
+    from config import autocomplete_limit
+    from database import Station, session
+
+
+class Autocomplete:
+    '''车站名前缀补全：站名、拼音、拼音码、首字母
+
+    Note:
+        - 所有 (键, 车站编号) 按键排序，前缀对应 bisect 得到的连续区间
+        - 车站按 hot 降序、priority 降序、站名编号，编号越小越靠前，
+          区间内去重后最小的 limit 个编号即为结果
+        - 首次使用时从数据库中有效的车站及 online.load_stations、online.Train.stations 的本地缓存加载，
+          不访问网络；没有缓存时只能按站名补全（先执行一次 load_stations()、Train().stations）；
+          update 后下次使用时重建
+    '''
+    def complete(self, prefix, limit=autocomplete_limit):
+        '''
+        Argument:
+            - prefix: str, 不区分大小写
+            - limit: int
+        Return:
+            - list[str], 站名
+        '''
+        import numpy as np
+
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return list()
+        keys = self._api('keys')
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix+chr(0x10ffff), lo)
+        names = self._api('names')
+        return [names[ith] for ith in np.unique(self._api('ids')[lo:hi])[:limit].tolist()]
+
+    def update(self):
+        for key in tuple(self.__dict__.keys()):
+            if key.startswith('_'):
+                delattr(self, key)
+
+    def build(self, stations, ranks=None, names=None):
+        '''
+        Argument:
+            - stations: iteration[tuple[拼音码, 站名, 电报码, 拼音, 首字母]], 见 online.load_stations
+            - ranks: NoneType or dict[str, Station], 见 online.Train.stations（按城市名）
+            - names: NoneType or set[str], 只保留（并至少按站名索引）的站名
+        '''
+        import numpy as np
+
+        ranks = ranks or dict()
+        aliases = dict()
+        for code, name, _, pinyin, initial in stations:
+            if names is None or name in names:
+                aliases.setdefault(name, set()).update((name, code, pinyin, initial))
+        for name in set() if names is None else names-aliases.keys():
+            aliases[name] = {name}  # 不在 12306 车站列表中，只能按站名补全
+        for name, value in aliases.items():
+            rank = ranks.get(name)
+            if rank is not None:
+                value.update(rank.match)
+                value.add(rank.quanpin)
+        self._names = sorted(aliases, key=lambda name: (*self._rank(ranks, name), name))
+        entries = sorted(
+            (str(alias).lower(), ith)
+            for ith, name in enumerate(self._names) for alias in aliases[name] if alias
+        )
+        self._keys = [key for key, _ in entries]
+        self._ids = np.array([ith for _, ith in entries], dtype=np.int32)
+
+    @staticmethod
+    def _rank(ranks, name):
+        '''站名找不到时按去掉方位后缀的城市名（北京西 -> 北京）
+        '''
+        rank = ranks.get(name)
+        if rank is None and name[-1:] in '东南西北':
+            rank = ranks.get(name[:-1])
+        if rank is None:
+            return 0, 0
+        return -int(rank.hot or 0), -int(rank.priority or 0)
+
+    def _load(self):
+        try:
+            from .online import load_stations_columns
+            from .online.cache import ResponseCache
+        except:
+            from online import load_stations_columns
+            from online.cache import ResponseCache
+
+        names = {name for name, in session.query(Station.name).filter_by(is_valid=True)}
+        stations = load_stations_columns(download=False)
+        headers = '拼音码', '站名', '电报码', '拼音', '首字母'
+        stations = () if stations is None else zip(*(stations[name] for name in headers))
+        self.build(stations, ResponseCache().get('stations', dict()), names)
+
+    def _api(self, name):
+        if not hasattr(self, f'_{name}'):
+            self._load()
+        return getattr(self, f'_{name}')
+
+autocomplete = Autocomplete()
@@ -0,0 +1,240 @@
+'''热点路径基准测试：搜索、订票、订单过期
+
+Example:
+    python -m code.benchmark --trains 500 --stops 12 --output before.json
+    python -m code.benchmark --output after.json --compare before.json
+    python -m code.benchmark --imports
+'''
+__all__ = ('seed', 'clean', 'run', 'compare', 'imports')
+
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from datetime import date, datetime, time as Time, timedelta
+
+from sqlalchemy import event, func
+
+try:
+    from .config import import_budget_seconds
+    from .database import (
+        City, Order, Station, Journey, StationPair, Capacity, Ticket, User, get_engine, session, transaction,
+    )
+    from .utils import add, get, update
+except:
+    from config import import_budget_seconds
+    from database import (
+        City, Order, Station, Journey, StationPair, Capacity, Ticket, User, get_engine, session, transaction,
+    )
+    from utils import add, get, update
+
+
+prefix = 'BENCH'
+
+
+class _Counter:
+    '''统计 SQL 语句条数
+    '''
+    def __init__(self):
+        self.queries = 0
+        event.listen(get_engine(), 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.queries += 1
+
+
+def seed(stations=200, trains=500, stops=12, carriages=8, seats=80, users=100, random_state=0):
+    '''在当前数据库中生成合成时刻表（车站名、车次均以 BENCH 为前缀，可重复调用）
+
+    Return:
+        - tuple[list[str], list[str]], (车站名, 车次)
+    '''
+    from faker import Faker
+
+    rng = random.Random(random_state)
+    names = [f'{prefix}{i}' for i in range(stations)]
+    numbers = [f'{prefix}{i}' for i in range(trains)]
+    if get._by(Station, name=names[-1]) is None:
+        # 与 add.station 相同，显式指定 id（psql 导入的数据不会推进序列）
+        with transaction():
+            city_id = (session.query(func.max(City.id)).scalar() or 0) + 1
+            session.add(City(id=city_id, name=f'{prefix}市', province=f'{prefix}省'))
+            start = session.query(func.max(Station.id)).scalar() or 0
+            session.add_all(
+                Station(id=start+ith+1, name=name, city_id=city_id) for ith, name in enumerate(names)
+            )
+    if get._by(Capacity, train_number=numbers[-1]) is None:
+        timetable = dict()
+        for number in numbers:
+            minute = rng.randrange(6*60, 22*60)
+            route, journeys = rng.sample(names, stops), list()
+            for ith, name in enumerate(route):
+                arrive = None if ith==0 else Time(minute//60%24, minute%60)
+                minute += 0 if ith==0 else rng.randrange(2, 6)
+                depart = None if ith==stops-1 else Time(minute//60%24, minute%60)
+                journeys.append((name, arrive, depart, None, None, 50*ith))
+                minute += rng.randrange(20, 90)
+            seat_types = [rng.randrange(1, 19) for _ in range(carriages)]
+            timetable[number] = [(t, seats) for t in seat_types], journeys
+        add.trains(timetable)
+    if session.query(User).filter(User.name.like(f'{prefix}%')).count() < users:
+        fake = Faker('zh')
+        with transaction():
+            session.add_all(
+                User(f'{prefix}{ith}', '18912341234', fake.unique.ssn(), 'benchmark')
+                for ith in range(users)
+            )
+    update.cache()
+    return names, numbers
+
+
+def clean():
+    '''删除 seed 生成的数据
+    '''
+    like = f'{prefix}%'
+    with transaction():
+        session.query(Ticket).filter(Ticket.train_number.like(like)).delete(synchronize_session=False)
+        session.query(Order).filter(Order.train_number.like(like)).delete(synchronize_session=False)
+        session.query(StationPair).filter(StationPair.train_number.like(like)).delete(synchronize_session=False)
+        session.query(Journey).filter(Journey.train_number.like(like)).delete(synchronize_session=False)
+        session.query(Capacity).filter(Capacity.train_number.like(like)).delete(synchronize_session=False)
+        session.query(User).filter(User.name.like(like)).delete(synchronize_session=False)
+        session.query(Station).filter(Station.name.like(like)).delete(synchronize_session=False)
+        session.query(City).filter(City.name.like(like)).delete(synchronize_session=False)
+    update.cache()
+
+
+def _measure(counter, function, arguments):
+    latencies, queries = list(), counter.queries
+    for args in arguments:
+        begin = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter()-begin)
+    queries = counter.queries - queries
+    latencies.sort()
+    percentile = lambda p: 1000 * latencies[min(len(latencies)-1, int(p*len(latencies)))]
+    return {
+        'calls': len(latencies), 'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99),
+        'mean_ms': 1000*sum(latencies)/len(latencies), 'queries_per_call': queries/len(latencies),
+    }
+
+
+def run(calls=200, random_state=0, **kwargs):
+    '''
+    Argument:
+        - calls: int, 每个函数调用次数
+        - kwargs: 传给 seed
+    Return:
+        - dict
+    '''
+    rng = random.Random(random_state)
+    names, numbers = seed(random_state=random_state, **kwargs)
+    counter = _Counter()
+    user_ids = [i for i, in session.query(User.id).filter(User.name.like(f'{prefix}%'))]
+    pairs = [rng.sample(names, 2) for _ in range(calls)]
+    depart_date = date.today() + timedelta(days=rng.randrange(30, 3650))
+    get.train_numbers_by_stations(*pairs[0])  # 预热时刻表索引，不计入结果
+
+    def order(number):
+        journeys = get.journeys_by_train_number(number)
+        i = rng.randrange(len(journeys)-1)
+        j = rng.randrange(i+1, len(journeys))
+        names = [get._by(Station.name, id=x.station_id)[0] for x in (journeys[i], journeys[j])]
+        order = add.order(rng.choice(user_ids), number, 1, None, depart_date, *names)
+        orders.append(order.id)
+        return order
+
+    def ticket(id):
+        return add.ticket(id=id)
+
+    orders = list()
+    results = {
+        'train_numbers_by_stations': _measure(counter, get.train_numbers_by_stations, pairs),
+        'train_numbers_by_stations_transfer': _measure(
+            counter, get.train_numbers_by_stations_transfer, pairs,
+        ),
+        'remaining_tickets_number': _measure(
+            counter, get.remaining_tickets_number,
+            [(rng.choice(numbers), 1, depart_date) for _ in range(calls)],
+        ),
+        'add.order': _measure(counter, order, [(rng.choice(numbers), ) for _ in range(calls)]),
+    }
+    paid, expired = orders[:len(orders)//2], orders[len(orders)//2:]
+    results['add.ticket'] = _measure(counter, ticket, [(id, ) for id in paid])
+    with transaction():
+        session.query(Order).filter(Order.id.in_(expired)) \
+            .update({Order.create_date: datetime.now()-timedelta(days=1)}, synchronize_session=False)
+    results['update.orders'] = _measure(counter, update.orders, [()])
+    return {
+        'time': datetime.now().isoformat(), 'python': platform.python_version(),
+        'parameters': dict(calls=calls, random_state=random_state, **kwargs), 'results': results,
+    }
+
+
+def compare(new, old):
+    '''
+    Return:
+        - dict[str, dict[str, float]], 新旧结果之比
+    '''
+    return {
+        name: {key: value/old['results'][name][key] for key, value in result.items() if old['results'][name][key]}
+        for name, result in new['results'].items() if name in old['results']
+    }
+
+
+def imports(modules=('code', 'code.utils', 'code.api', 'code.online'), repeat=5):
+    '''在新的解释器中测量模块的导入耗时（取最小值），不连接数据库
+
+    Return:
+        - dict[str, dict[str, float or bool]]
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = dict()
+    for module in modules:
+        script = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter()-t)'
+        seconds = min(
+            float(subprocess.check_output((sys.executable, '-c', script), cwd=root))
+            for _ in range(repeat)
+        )
+        results[module] = {
+            'seconds': seconds, 'within_budget': not import_budget_seconds or seconds<=import_budget_seconds,
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='搜索、订票、订单过期基准测试')
+    parser.add_argument('--stations', type=int, default=200)
+    parser.add_argument('--trains', type=int, default=500)
+    parser.add_argument('--stops', type=int, default=12)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--random-state', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON 结果文件')
+    parser.add_argument('--compare', default=None, help='与之前的 JSON 结果比较')
+    parser.add_argument('--clean', action='store_true', help='结束后删除合成数据')
+    parser.add_argument('--imports', action='store_true', help='只测量模块导入耗时')
+    args = parser.parse_args()
+    if args.imports:
+        for name, value in imports().items():
+            print(f'{name:36s} {value["seconds"]*1000:8.2f}ms {"" if value["within_budget"] else "over budget"}')
+        sys.exit(0)
+    result = run(
+        args.calls, args.random_state, stations=args.stations, trains=args.trains, stops=args.stops,
+    )
+    for name, value in result['results'].items():
+        print(f'{name:36s} p50={value["p50_ms"]:8.2f}ms p99={value["p99_ms"]:8.2f}ms queries={value["queries_per_call"]:.1f}')
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            for name, ratio in compare(result, json.load(f)).items():
+                print(f'{name:36s} p50 x{ratio.get("p50_ms", 0):.2f} p99 x{ratio.get("p99_ms", 0):.2f}')
+    if args.clean:
+        clean()
@@ -0,0 +1,126 @@
+__all__ = ('QueryCache', )
+
+
+import collections
+import functools
+import threading
+import time
+
+
+class QueryCache:
+    '''查询缓存：按参数记忆化，LRU + TTL 淘汰，按标签失效
+
+    Argument:
+        - maxsize: int
+        - ttl: int or float, 秒
+        - enabled: bool, False 时直接调用原函数
+
+    Note:
+        - list、set、dict 结果在写入和每次命中时浅拷贝，调用方修改返回值不影响缓存；
+          tuple、frozenset 等不可变结果直接共享
+
+    Example:
+        >>> query_cache = QueryCache(1024, 600)
+        >>> @query_cache.memoize('station')
+        ... def stations(): ...
+        >>> @query_cache.invalidates('station')
+        ... def add_station(name): ...
+    '''
+    def __init__(self, maxsize, ttl, enabled=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self._data = collections.OrderedDict()  # key -> (expire, value, tags)
+        self._tags = collections.defaultdict(set)  # tag -> keys
+        self._lock = threading.RLock()
+
+    def memoize(self, *tags):
+        def decorator(function):
+            name = function.__qualname__
+            @functools.wraps(function)
+            def wrapper(cls, *args, **kwargs):
+                if not self.enabled:
+                    return function(cls, *args, **kwargs)
+                key = name, args, tuple(sorted(kwargs.items()))
+                with self._lock:
+                    found, value = self._get(key)
+                    if found:
+                        self.hits[name] += 1
+                        return self._copy(value)
+                    self.misses[name] += 1
+                value = function(cls, *args, **kwargs)
+                self._set(key, self._copy(value), tags)
+                return value
+            return wrapper
+        return decorator
+
+    def invalidates(self, *tags):
+        '''被装饰的函数正常返回（事务已提交）后使标签失效
+        '''
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                result = function(*args, **kwargs)
+                self.invalidate(*tags)
+                return result
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        '''
+        Return:
+            - dict, 命中数、未命中数及当前条目数
+        '''
+        with self._lock:
+            return dict(
+                hits=sum(self.hits.values()), misses=sum(self.misses.values()),
+                size=len(self._data), functions={
+                    name: (self.hits[name], self.misses[name])
+                    for name in self.hits.keys() | self.misses.keys()
+                },
+            )
+
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, (list, set, dict)):
+            return value.copy()
+        return value
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            if item[0] <= time.monotonic():
+                self._pop(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, item[1]
+
+    def _set(self, key, value, tags):
+        with self._lock:
+            self._pop(key)
+            self._data[key] = time.monotonic()+self.ttl, value, tags
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._data) > self.maxsize:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            for tag in item[2]:
+                self._tags[tag].discard(key)
@@ -7,12 +7,41 @@ password = '123456'
 hostport = '127.0.0.1:5432'
 database = 'project_2'
 database_url = f'postgresql://{username}:{password}@{hostport}/{database}'
+pool_size = 10
+max_overflow = 20
+pool_pre_ping = True
+pool_recycle = 30 * 60
 
 # cache configuration
 is_cached = True
+query_cache_size = 4096
+query_cache_ttl = 10 * 60
+inventory_ttl = 60  # seconds a seat bitmap is trusted before it is rebuilt, bounds staleness across processes
+
+# profiler configuration
+is_profiled = True
+query_budget = 20  # queries per utils call before QueryBudgetWarning, 0 to disable
+import_budget_seconds = 0.5  # python -m code.benchmark --imports, 0 to disable
+
+# search configuration
+min_connection_minutes = 20
+transfer_limit = 10
+max_transfers = 3  # upper bound of transfers for /api/earliest
+autocomplete_limit = 10
+
+# password configuration
+password_method = 'pbkdf2:sha256:150000'  # werkzeug method with iterations
+password_salt_length = 8
+password_workers = 0  # size of the hashing process pool, 0 to hash inline
+password_length = 255  # admin/user password column, see data/password.sql
 
 # order and ticket configuration
 residence_seconds = 30 * 60
+sweep_seconds = 60
+is_sweeping = False  # run the order Sweeper inside the Flask app (one per process); prefer python -m code.sweeper
+partition_ahead_days = 120  # monthly order/ticket partitions created ahead, see data/partition.sql
+archive_after_days = 30  # partitions ending this many days ago are archived
 
 # flask configuration
-pass
+page_size = 20
+max_page_size = 100
@@ -1,25 +1,75 @@
-__all__ = ('session', 'Admin', 'User', 'City', 'Order', 'Station', 'Journey', 'SeatType', 'Capacity', 'Ticket')
+__all__ = ('get_engine', 'session', 'status', 'transaction', 'Admin', 'User', 'City', 'Order', 'Station', 'Journey', 'StationPair', 'SeatType', 'Capacity', 'Ticket')
 
 
+import threading
+
+from contextlib import contextmanager
+from enum import Enum
+
 from sqlalchemy import (
     Column, Sequence, String, Integer, Float, Time, Date, TIMESTAMP, Boolean,
-    ForeignKey, text, create_engine,
+    ForeignKey, Index, text, create_engine,
 )
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-from werkzeug.security import generate_password_hash, check_password_hash
-
 try:
-    from .config import database_url
+    from .config import database_url, password_length, pool_size, max_overflow, pool_pre_ping, pool_recycle
+    from .password import hash_password, verify_password, needs_rehash
 except:
-    from config import database_url
+    from config import database_url, password_length, pool_size, max_overflow, pool_pre_ping, pool_recycle
+    from password import hash_password, verify_password, needs_rehash
+
 
+status = Enum('status', ('booked', 'paid', 'canceled'))
 
 Base = declarative_base()
-engine = create_engine(database_url)
-DBSession = sessionmaker(bind=engine)
-session = DBSession()
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    '''首次使用时创建 engine（导入本模块不加载数据库驱动、不连接数据库）
+    '''
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    database_url, pool_size=pool_size, max_overflow=max_overflow,
+                    pool_pre_ping=pool_pre_ping, pool_recycle=pool_recycle,
+                )
+    return _engine
+
+def __getattr__(name):
+    if name == 'engine':  # 兼容 from database import engine
+        return get_engine()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+class LazySession(Session):
+    '''首次执行语句时才绑定 engine
+    '''
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(mapper, clause, **kwargs)
+
+DBSession = sessionmaker(class_=LazySession)
+session = scoped_session(DBSession)  # one session per thread
+
+@contextmanager
+def transaction():
+    '''当前线程会话的事务，正常退出时提交，异常时回滚
+
+    Example:
+        >>> with transaction():
+        ...     session.add(station)
+    '''
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
 
 def __repr__(self):
     f = lambda x: not x.startswith('_')
@@ -34,17 +84,23 @@ class Admin(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String(30), nullable=False, unique=True)
-    password = Column(String(100), nullable=False)
+    password = Column(String(password_length), nullable=False)
 
     def __init__(self, name, password):
         self.name = name
         self.set_password(password)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        '''校验成功且哈希强度与配置不同时重新计算（需调用方提交）
+        '''
+        if not verify_password(self.password, password):
+            return False
+        if needs_rehash(self.password):
+            self.set_password(password)
+        return True
 
 
 class User(Base):
@@ -54,7 +110,7 @@ class User(Base):
     name = Column(String(30), nullable=False)
     phone_number = Column(String(11), nullable=False)
     id_card_number = Column(String(18), nullable=False, unique=True)
-    password = Column(String(100), nullable=False)
+    password = Column(String(password_length), nullable=False)
 
     def __init__(self, name, phone_number, id_card, password):
         self.name = name
@@ -63,10 +119,16 @@ class User(Base):
         self.set_password(password)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        '''校验成功且哈希强度与配置不同时重新计算（需调用方提交）
+        '''
+        if not verify_password(self.password, password):
+            return False
+        if needs_rehash(self.password):
+            self.set_password(password)
+        return True
 
 
 class City(Base):
@@ -79,6 +141,9 @@ class City(Base):
 
 class Order(Base):
     __tablename__ = 'order'
+    __table_args__ = (
+        Index('order_status_create_date_index', 'status', 'create_date'),
+    )
 
     id = Column(Integer, primary_key=True)
     status = Column(Integer, nullable=False)
@@ -117,6 +182,18 @@ class Journey(Base):
     station_id = Column(Integer, ForeignKey('station.id'))
 
 
+class StationPair(Base):
+    '''车站对 -> 直达车次，由 journey 派生（见 data/station_pair.sql）
+    '''
+    __tablename__ = 'station_pair'
+
+    from_station_id = Column(Integer, primary_key=True)
+    to_station_id = Column(Integer, primary_key=True)
+    train_number = Column(String(20), primary_key=True, index=True)
+    from_index = Column(Integer, nullable=False)
+    to_index = Column(Integer, nullable=False)
+
+
 class SeatType(Base):
     __tablename__ = 'seat_type'
 
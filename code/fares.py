@@ -0,0 +1,130 @@
+__all__ = ('FareMatrix', 'fare_matrix')
+
+
+try:
+    from .database import Capacity, SeatType, session
+    from .timetable import timetable
+except:
+    from database import Capacity, SeatType, session
+    from timetable import timetable
+
+
+class FareMatrix:
+    '''票价矩阵：车次累计里程 × 座位类型基础价
+
+    Note:
+        - 所有车次的累计里程（按停靠站数组下标）拼接为一个数组，starts 为各车次的起点
+        - 票价 = 基础价 × 区间里程，与 add.order 一致
+        - 首次使用时从 seat_type、capacity 及时刻表加载，update 后下次使用时重建
+    '''
+    @property
+    def seat_types(self):
+        '''
+        Return:
+            - numpy.ndarray[str], 列 -> 座位类型名
+        '''
+        return self._api('seat_types')
+
+    @property
+    def prices(self):
+        '''
+        Return:
+            - numpy.ndarray[float], 列 -> 基础价
+        '''
+        return self._api('prices')
+
+    def basic_price(self, seat_type):
+        '''
+        Argument:
+            - seat_type: int, seat_type.id
+        Return:
+            - float or NoneType
+        '''
+        column = self._api('columns').get(seat_type)
+        return None if column is None else float(self.prices[column])
+
+    def quote(self, train_number, from_index, to_index):
+        '''
+        Return:
+            - dict[str, float] or NoneType, 座位类型名 -> 票价
+        '''
+        return self.quote_many([(train_number, from_index, to_index)])[0]
+
+    def quote_many(self, segments):
+        '''批量报价：所有区间、所有座位类型一次计算
+
+        Argument:
+            - segments: iteration[tuple[train_number, from_index, to_index] or NoneType],
+                停靠站数组下标
+        Return:
+            - list[dict[str, float] or NoneType], 票价保留两位小数，车次未知或区间为 None 时为 None
+        '''
+        import numpy as np
+
+        segments = list(segments)
+        rows = self._api('rows')
+        known = [
+            ith for ith, segment in enumerate(segments)
+            if segment is not None and segment[0] in rows
+        ]
+        result = [None] * len(segments)
+        if not known:
+            return result
+        trains = np.array([rows[segments[ith][0]] for ith in known])
+        starts = self._api('starts')[trains]
+        from_index = starts + np.array([segments[ith][1] for ith in known])
+        to_index = starts + np.array([segments[ith][2] for ith in known])
+        distances = self._api('distances')
+        fares = np.round((distances[to_index]-distances[from_index])[:, None] * self.prices[None, :], 2)
+        available = self._api('available')[trains]
+        for ith, fare, mask in zip(known, fares.tolist(), available):
+            result[ith] = {
+                name: fare[column] for column, name in enumerate(self.seat_types) if mask[column]
+            }
+        return result
+
+    def update(self):
+        for key in tuple(self.__dict__.keys()):
+            if key.startswith('_'):
+                delattr(self, key)
+
+    def build(self, seat_types, capacities, stops):
+        '''
+        Argument:
+            - seat_types: iteration[tuple[id, name, basic_price]]
+            - capacities: iteration[tuple[train_number, seat_type]]
+            - stops: dict[str, tuple[Stop]], 见 Timetable.stops
+        '''
+        import numpy as np
+
+        seat_types = sorted(seat_types)
+        columns = {id: column for column, (id, _, _) in enumerate(seat_types)}
+        rows = {train_number: row for row, train_number in enumerate(stops)}
+        lengths = np.array([len(value) for value in stops.values()], dtype=np.int64)
+        available = np.zeros((len(rows), len(columns)), dtype=bool)
+        for train_number, seat_type in capacities:
+            if train_number in rows and seat_type in columns:
+                available[rows[train_number], columns[seat_type]] = True
+        self._seat_types = np.array([name for _, name, _ in seat_types], dtype=object)
+        self._prices = np.array([price for _, _, price in seat_types], dtype=np.float64)
+        self._columns = columns
+        self._rows = rows
+        self._starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+        self._distances = np.fromiter(
+            (stop.distance for value in stops.values() for stop in value),
+            dtype=np.float64, count=int(lengths.sum()),
+        )
+        self._available = available
+
+    def _load(self):
+        seat_types = session.query(SeatType.id, SeatType.name, SeatType.basic_price)
+        capacities = session.query(Capacity.train_number, Capacity.seat_type) \
+            .filter_by(is_valid=True).distinct()
+        self.build(seat_types.all(), capacities.all(), timetable.stops)
+
+    def _api(self, name):
+        if not hasattr(self, f'_{name}'):
+            self._load()
+        return getattr(self, f'_{name}')
+
+fare_matrix = FareMatrix()
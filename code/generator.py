@@ -0,0 +1,206 @@
+'''生成压测用的用户、订单、车票，分批经 COPY 写入数据库
+
+Example:
+    python -m code.generator --users 1000000 --orders 5000000 --days 60
+'''
+__all__ = ('generate', 'users', 'orders')
+
+
+import argparse
+import bisect
+import itertools
+import random
+import time
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+try:
+    from .database import Capacity, Order, SeatType, User, get_engine, session, status
+    from .identity import id_card_validator
+    from .loader import copy_rows, reset_sequence
+    from .password import hash_password
+    from .timetable import timetable
+except:
+    from database import Capacity, Order, SeatType, User, get_engine, session, status
+    from identity import id_card_validator
+    from loader import copy_rows, reset_sequence
+    from password import hash_password
+    from timetable import timetable
+
+
+# 节假日（月, 日, 天数）及订票量倍数
+holidays = (((1, 20, 30), 5.0), ((5, 1, 5), 3.0), ((10, 1, 7), 4.0))
+# 订单状态比例：已支付、已取消、待支付
+statuses = ((status.paid.value, 0.7), (status.canceled.value, 0.2), (status.booked.value, 0.1))
+
+
+def _line(*values):
+    return ('\t'.join('\\N' if v is None else str(v) for v in values) + '\n').encode('utf-8')
+
+
+def _id_card(ith, districts):
+    '''第 ith 个合法且互不相同的身份证号
+    '''
+    seq, ith = ith % 1000, ith // 1000
+    birthday = date(1940, 1, 1) + timedelta(days=ith%(60*365))
+    code = f'{districts[ith//(60*365)%len(districts)]}{birthday:%Y%m%d}{seq:03d}'
+    total = sum(w*int(c) for w, c in zip(id_card_validator.weights, code))
+    return code + id_card_validator.checksums[total%11]
+
+
+def users(number, start_id, password='loadtest'):
+    '''
+    Return:
+        - iteration[bytes], COPY text 行：id, name, phone_number, id_card_number, password
+    '''
+    districts = sorted(id_card_validator.districts)
+    pwhash = hash_password(password)  # 逐个哈希百万用户过慢，共用一个
+    rng = random.Random(start_id)
+    for ith in range(number):
+        phone = f'1{rng.choice("3578")}{rng.randrange(10**9):09d}'
+        yield _line(start_id+ith, f'用户{start_id+ith}', phone, _id_card(start_id+ith, districts), pwhash)
+
+
+def _date_weights(start, days):
+    weights = list()
+    for ith in range(days):
+        day, weight = start + timedelta(days=ith), 1.0
+        for (month, first, length), factor in holidays:
+            begin = date(day.year, month, first)
+            if begin <= day < begin+timedelta(days=length):
+                weight = factor
+        weights.append(weight)
+    return weights
+
+
+def orders(number, start_id, user_ids, start, days, random_state=0, zipf=1.1):
+    '''按日期逐日生成订单和车票，内存只保存当天的座位分配
+
+    Note:
+        - 热门车次的车厢售罄后跳过，实际订单数可能少于 number
+
+    Argument:
+        - number: int, 订单总数
+        - start_id: int, 第一个订单的 id
+        - user_ids: sequence[int], 下单用户 id
+        - start: datetime.date, 第一个出发日期
+        - days: int
+        - zipf: float, 车次热度的 Zipf 指数，越大越集中于热门线路
+    Return:
+        - iteration[tuple[str, bytes]], ('order' 或 'ticket', COPY text 行)
+    '''
+    rng = random.Random(random_state)
+    prices = dict(session.query(SeatType.id, SeatType.basic_price))
+    carriages = dict()
+    for train_number, carriage_index, seat_num, seat_type in session.query(
+            Capacity.train_number, Capacity.carriage_index, Capacity.seat_num, Capacity.seat_type
+        ).filter_by(is_valid=True):
+        carriages.setdefault(train_number, list()).append((carriage_index, seat_num, prices[seat_type]))
+    numbers = [n for n in timetable.stops if n in carriages and len(timetable.stops[n])>1]
+    rng.shuffle(numbers)
+    popularity = list(itertools.accumulate(1/(i+1)**zipf for i in range(len(numbers))))
+    cumulative = list(itertools.accumulate(s for _, s in statuses))
+    weights = _date_weights(start, days)
+    total, order_id = sum(weights), start_id
+    for ith, weight in enumerate(weights):
+        depart_date = start + timedelta(days=ith)
+        count = round(number*weight/total) if ith<days-1 else start_id+number-order_id
+        seats = dict()  # (train_number, carriage_index) -> next seat
+        for _ in range(count):
+            train_number = numbers[bisect.bisect(popularity, rng.random()*popularity[-1])]
+            stops = timetable.stops[train_number]
+            carriage_index, seat_num, price = rng.choice(carriages[train_number])
+            seat = seats.get((train_number, carriage_index), 1)
+            if seat > seat_num:  # 售罄
+                continue
+            seats[train_number, carriage_index] = seat + 1
+            i = rng.randrange(len(stops)-1)
+            j = rng.randrange(i+1, len(stops))
+            status_ = statuses[bisect.bisect(cumulative, rng.random()*cumulative[-1])][0]
+            create_date = datetime.combine(depart_date, datetime.min.time()) \
+                - timedelta(minutes=rng.randrange(10, 30*24*60))
+            yield 'order', _line(
+                order_id, status_, price*(stops[j].distance-stops[i].distance),
+                rng.choice(user_ids), create_date, stops[i].journey_id, stops[j].journey_id,
+                carriage_index, seat, depart_date, train_number,
+            )
+            if status_ == status.paid.value:
+                yield 'ticket', _line(
+                    order_id, carriage_index, stops[i].journey_id, stops[j].journey_id, depart_date,
+                    seat, train_number, rng.random()<0.3,
+                )
+            order_id += 1
+
+
+_columns = {
+    'user': 'id, name, phone_number, id_card_number, password',
+    'order': 'id, status, price, user_id, create_date, depart_journey, arrive_journey, '
+        'carriage_index, seat_num, depart_date, train_number',
+    'ticket': 'order_id, carriage_index, depart_journey, arrive_journey, depart_date, seat_num, '
+        'train_number, is_print',
+}
+
+
+def _copy(rows, batch):
+    '''每 batch 行一次 COPY 并提交
+    '''
+    counts = dict()
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        rows = iter(rows)
+        while True:
+            chunk = dict()
+            for table, line in itertools.islice(rows, batch):
+                chunk.setdefault(table, list()).append(line)
+            if not chunk:
+                break
+            for table in ('user', 'order', 'ticket'):
+                if table in chunk:
+                    copy_rows(cursor, table, chunk[table], _columns[table])
+                    counts[table] = counts.get(table, 0) + len(chunk[table])
+            connection.commit()
+        for table in counts:
+            reset_sequence(cursor, table)
+        connection.commit()
+    finally:
+        connection.close()
+    return counts
+
+
+def generate(n_users=10000, n_orders=100000, start=None, days=60, batch=100000, random_state=0):
+    '''
+    Return:
+        - tuple[dict[str, int], float], (表名 -> 写入行数, 秒)
+    '''
+    start = start or date.today()
+    begin = time.perf_counter()
+    first_user = (session.query(func.max(User.id)).scalar() or 0) + 1
+    first_order = (session.query(func.max(Order.id)).scalar() or 0) + 1
+    counts = _copy((('user', line) for line in users(n_users, first_user)), batch)
+    if n_orders:
+        if n_users:
+            user_ids = range(first_user, first_user+n_users)
+        else:
+            user_ids = [i for i, in session.query(User.id)]
+        rows = orders(n_orders, first_order, user_ids, start, days, random_state)
+        counts.update(_copy(rows, batch))
+    session.remove()
+    return counts, time.perf_counter()-begin
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成压测数据')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--start', type=date.fromisoformat, default=None, help='第一个出发日期，默认今天')
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--batch', type=int, default=100000)
+    parser.add_argument('--random-state', type=int, default=0)
+    args = parser.parse_args()
+    counts, seconds = generate(args.users, args.orders, args.start, args.days, args.batch, args.random_state)
+    for table, count in counts.items():
+        print(f'{table}: {count} rows')
+    print(f'{sum(counts.values())} rows in {seconds:.2f}s')
@@ -0,0 +1,97 @@
+__all__ = ('IdCardValidator', 'id_card_validator')
+
+
+import re
+
+from collections import Counter
+from datetime import date, datetime
+
+try:
+    from .database import session
+except:
+    from database import session
+
+
+class IdCardValidator:
+    '''身份证号校验，与数据库函数 is_id_valid 结果一致
+
+    Note:
+        - 地址码集合首次使用时从 district 表加载一次
+        - 与 is_id_valid 相同，地址码在 district 中必须恰好出现一次
+    '''
+    pattern = re.compile(r'[0-9]{17}[0-9X]')
+    weights = (7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2)
+    checksums = '10X98765432'
+
+    def __init__(self, districts=None):
+        if districts is not None:
+            self._districts = self._unique(districts)
+
+    @property
+    def districts(self):
+        '''
+        Return:
+            - frozenset[str]
+        '''
+        if not hasattr(self, '_districts'):
+            self._districts = self._unique(code for code, in session.execute('select code from district'))
+        return self._districts
+
+    def is_valid(self, code, today=None):
+        '''
+        Argument:
+            - code: str
+            - today: NoneType or datetime.date
+        Return:
+            - bool
+        '''
+        if not self.pattern.fullmatch(code):
+            return False
+        if code[:6] not in self.districts:
+            return False
+        try:
+            birthday = datetime.strptime(code[6:14], '%Y%m%d').date()
+        except ValueError:
+            return False
+        if not date(1900, 1, 1) <= birthday <= (today or date.today()):
+            return False
+        total = sum(w*int(c) for w, c in zip(self.weights, code))
+        return code[17] == self.checksums[total%11]
+
+    def validate_many(self, codes, today=None):
+        '''批量校验（向量化），用于批量导入用户
+
+        Argument:
+            - codes: iteration[str]
+            - today: NoneType or datetime.date
+        Return:
+            - numpy.ndarray[bool]
+        '''
+        import numpy as np
+        import pandas as pd
+
+        codes = pd.Series(list(codes), dtype=object).fillna('').astype(str)
+        result = codes.str.match(self.pattern.pattern+r'\Z').to_numpy(dtype=bool, copy=True)
+        if not result.any():
+            return result
+        valid = codes[result]
+        birthdays = pd.to_datetime(valid.str[6:14], format='%Y%m%d', errors='coerce')
+        today = pd.Timestamp(today or date.today())
+        digits = np.frombuffer(''.join(valid.str[:17]).encode(), dtype=np.uint8).reshape(-1, 17) - ord('0')
+        totals = digits.astype(np.int64) @ np.array(self.weights)
+        result[result] = (
+            valid.str[:6].isin(self.districts).to_numpy()
+            & ((birthdays>=pd.Timestamp(1900, 1, 1)) & (birthdays<=today)).to_numpy()
+            & (valid.str[17].to_numpy() == np.array(list(self.checksums))[totals%11])
+        )
+        return result
+
+    def update(self):
+        if hasattr(self, '_districts'):
+            del self._districts
+
+    @staticmethod
+    def _unique(codes):
+        return frozenset(k for k, v in Counter(codes).items() if v==1)
+
+id_card_validator = IdCardValidator()
@@ -0,0 +1,132 @@
+__all__ = ('Inventory', 'inventory')
+
+
+import time
+
+try:
+    from .config import inventory_ttl
+    from .database import Capacity, Order, Ticket, session, status
+    from .timetable import timetable
+except:
+    from config import inventory_ttl
+    from database import Capacity, Order, Ticket, session, status
+    from timetable import timetable
+
+
+class Inventory:
+    '''座位占用位图
+
+    Argument:
+        - ttl: int or float, 秒，位图构建后超过 ttl 再次查询时从数据库重建
+
+    Note:
+        - 键为 (train_number, depart_date, carriage_index)
+        - 每个区间（相邻两站）一个位图，第 seat_num-1 位表示座位已售
+        - 首次查询时从 ticket 及未取消的 order 构建，之后随本进程的订票、退票、超时取消增量更新
+        - 一致性：位图只在本进程内共享，其他进程（其他 Web 进程、python -m code.sweeper）的写入
+          最多 ttl 秒后可见；回滚的订票同样在重建后消失。位图只用于余票查询，
+          add.order 选座仍在行锁下查询数据库，不会因位图过期而超售
+    '''
+    def __init__(self, ttl=inventory_ttl):
+        self.ttl = ttl
+        self._bitmaps = dict()  # key -> (expire, total, legs)
+
+    def remaining(self, train_number, depart_date, carriage_index, from_index=None, to_index=None):
+        '''
+        Argument:
+            - train_number: str
+            - depart_date: datetime.date
+            - carriage_index: int
+            - from_index, to_index: NoneType or int, 停靠站数组下标，默认全程
+        Return:
+            - int or NoneType
+        '''
+        total, used = self._used(train_number, depart_date, carriage_index, from_index, to_index)
+        if total is None:
+            return None
+        return total - bin(used).count('1')
+
+    def free_seats(self, train_number, depart_date, carriage_index, from_index=None, to_index=None):
+        '''
+        Return:
+            - iteration[int], 区间内空闲的座位号
+        '''
+        total, used = self._used(train_number, depart_date, carriage_index, from_index, to_index)
+        for seat_num in range(1, (total or 0)+1):
+            if not used>>(seat_num-1) & 1:
+                yield seat_num
+
+    def book(self, record):
+        '''
+        Argument:
+            - record: Order or Ticket
+        '''
+        self._apply(record, True)
+
+    def release(self, record):
+        '''
+        Argument:
+            - record: Order or Ticket
+        '''
+        self._apply(record, False)
+
+    def update(self):
+        self._bitmaps.clear()
+
+    def _used(self, train_number, depart_date, carriage_index, from_index, to_index):
+        value = self._get(train_number, depart_date, carriage_index)
+        if value is None:
+            return None, 0
+        total, legs = value
+        used = 0
+        for leg in legs[from_index:to_index]:
+            used |= leg
+        return total, used
+
+    def _get(self, train_number, depart_date, carriage_index):
+        key = train_number, depart_date, carriage_index
+        item = self._bitmaps.get(key)
+        if item is None or item[0] <= time.monotonic():
+            item = self._bitmaps[key] = time.monotonic()+self.ttl, self._load(*key)
+        return item[1]
+
+    def _load(self, train_number, depart_date, carriage_index):
+        total = session.query(Capacity.seat_num) \
+            .filter_by(train_number=train_number, carriage_index=carriage_index, is_valid=True) \
+            .first()
+        stops = timetable.stops.get(train_number)
+        if total is None or not stops:
+            return None
+        legs = [0] * (len(stops)-1)
+        condition = dict(
+            train_number=train_number, depart_date=depart_date, carriage_index=carriage_index,
+        )
+        columns = lambda model: (model.seat_num, model.depart_journey, model.arrive_journey)
+        orders = session.query(*columns(Order)).filter_by(**condition) \
+            .filter(Order.status!=status.canceled.value)
+        tickets = session.query(*columns(Ticket)).filter_by(**condition)
+        for seat_num, depart_journey, arrive_journey in orders.union_all(tickets):
+            bit = 1 << (seat_num-1)
+            for leg in range(*self._segment(train_number, depart_journey, arrive_journey)):
+                legs[leg] |= bit
+        return total[0], legs
+
+    def _apply(self, record, occupied):
+        key = record.train_number, record.depart_date, record.carriage_index
+        item = self._bitmaps.get(key)
+        if item is None or item[1] is None:  # 尚未加载，下次查询时从数据库构建
+            return
+        _, legs = item[1]
+        bit = 1 << (record.seat_num-1)
+        for leg in range(*self._segment(record.train_number, record.depart_journey, record.arrive_journey)):
+            legs[leg] = legs[leg]|bit if occupied else legs[leg]&~bit
+
+    @staticmethod
+    def _segment(train_number, depart_journey, arrive_journey):
+        '''journey id -> 区间下标范围，已失效的停靠站按全程计算
+        '''
+        stops = timetable.stops[train_number]
+        positions = {stop.journey_id: ith for ith, stop in enumerate(stops)}
+        return positions.get(depart_journey, 0), positions.get(arrive_journey, len(stops)-1)
+
+inventory = Inventory()
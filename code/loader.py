@@ -0,0 +1,260 @@
+'''批量导入时刻表数据（COPY FROM STDIN）
+
+Example:
+    python -m code.loader data/sql.7z --schema data/main.sql
+    python -m code.loader path/to/csv/ --tables station journey
+'''
+__all__ = ('load', 'copy_rows', 'reset_sequence')
+
+
+import argparse
+import contextlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+try:
+    from .database import get_engine
+except:
+    from database import get_engine
+
+
+# 按外键依赖排序
+tables = ('seat_type', 'city', 'station', 'journey', 'capacity', 'district')
+
+_insert = re.compile(r"INSERT INTO (?:public\.)?(\w+)\s*(?:\((.*?)\))?\s*VALUES\s*\((.*)\);\s*$")
+_value = re.compile(r"'(?:[^']|'')*'|[^,\s]+")
+
+
+class _Stream:
+    '''把按行产生的 bytes 包装成 copy_expert 需要的可读对象
+    '''
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size<0 or len(self._buffer)<size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _escape(value):
+    '''SQL 字面量 -> COPY text 格式
+    '''
+    if value.lower() == 'null':
+        return '\\N'
+    if value.startswith("'"):
+        value = value[1:-1].replace("''", "'")
+        for old, new in (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')):
+            value = value.replace(old, new)
+    return value
+
+
+def _parse_inserts(lines, counter):
+    '''逐行解析 INSERT 语句
+    '''
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        match = _insert.match(line)
+        if match is None:
+            continue
+        counter['columns'] = match.group(2)
+        values = _value.findall(match.group(3))
+        counter['rows'] += 1
+        yield ('\t'.join(map(_escape, values)) + '\n').encode('utf-8')
+
+
+@contextlib.contextmanager
+def _open(source, table):
+    '''
+    Return:
+        - tuple[str, iteration[bytes]], 格式（'sql' 或 'csv'）及按行读取的内容
+    Note:
+        - 压缩包中没有 <table>.sql 时抛出 FileNotFoundError，目录中没有时返回 (None, None)
+        - 退出时关闭文件、删除临时目录；7z 进程正常读完后检查返回码
+    '''
+    if not source.endswith('.7z'):
+        for fmt in ('csv', 'sql'):
+            path = os.path.join(source, f'{table}.{fmt}')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    yield fmt, f
+                return
+        yield None, None
+        return
+    member = f'{table}.sql'
+    if member not in _members(source):
+        raise FileNotFoundError(f'{member} not found in {source}')
+    if shutil.which('7z'):
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(('7z', 'x', '-so', source, member), stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                yield 'sql', process.stdout
+                code = process.wait()
+                if code != 0:
+                    stderr.seek(0)
+                    message = stderr.read().decode(errors='replace').strip()
+                    raise RuntimeError(f'7z exited with {code} extracting {member}: {message}')
+            finally:
+                process.stdout.close()
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+        return
+    import py7zr  # optional, used when the 7z command is missing
+
+    path = tempfile.mkdtemp()
+    try:
+        with py7zr.SevenZipFile(source) as archive:
+            archive.extract(path, targets=[member])
+        with open(os.path.join(path, member), 'rb') as f:
+            yield 'sql', f
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _members(source):
+    '''
+    Return:
+        - set[str], 压缩包中的文件名
+    '''
+    if shutil.which('7z'):
+        output = subprocess.run(('7z', 'l', '-slt', source), stdout=subprocess.PIPE, check=True).stdout
+        return {line[7:] for line in output.decode(errors='replace').splitlines() if line.startswith('Path = ')}
+    import py7zr
+
+    with py7zr.SevenZipFile(source) as archive:
+        return set(archive.getnames())
+
+
+def copy_rows(cursor, table, lines, columns=None, csv=False):
+    '''
+    Argument:
+        - cursor: psycopg2 cursor
+        - table: str
+        - lines: iteration[bytes], COPY text 或 CSV（首行为表头）
+        - columns: NoneType or str
+        - csv: bool
+    '''
+    columns = f' ({columns})' if columns else ''
+    option = ' with (format csv, header true)' if csv else ''
+    cursor.copy_expert(f'copy "{table}"{columns} from stdin{option}', _Stream(lines))
+
+
+def _deferred(cursor, table):
+    '''表上的非约束索引及外键，导入前删除、导入后重建
+    '''
+    cursor.execute('''
+        select indexname, indexdef from pg_indexes
+        where schemaname=current_schema and tablename=%s and indexname not in (
+            select conname from pg_constraint where conrelid=%s::regclass
+        )''', (table, f'"{table}"'))
+    indexes = cursor.fetchall()
+    cursor.execute('''
+        select conname, pg_get_constraintdef(oid) from pg_constraint
+        where conrelid=%s::regclass and contype='f'
+    ''', (f'"{table}"', ))
+    constraints = cursor.fetchall()
+    return indexes, constraints
+
+
+def load(source, names=tables, schema=None):
+    '''
+    Argument:
+        - source: str, sql.7z 或包含 <table>.sql/<table>.csv 的目录
+        - names: iteration[str]
+        - schema: NoneType or str, 先执行的建表脚本（如 data/main.sql）
+    Return:
+        - dict[str, tuple[int, float]], 表名 -> (行数, 秒)
+    '''
+    result = dict()
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        if schema is not None:
+            with open(schema, 'r', encoding='utf-8') as f:
+                cursor.execute(f.read())
+            connection.commit()
+        for table in names:
+            with _open(source, table) as (fmt, lines):
+                if fmt is None:
+                    print(f'{table}: not found in {source}, skipped')
+                    continue
+                begin = time.perf_counter()
+                indexes, constraints = _deferred(cursor, table)
+                for name, _ in indexes:
+                    cursor.execute(f'drop index "{name}"')
+                for name, _ in constraints:
+                    cursor.execute(f'alter table "{table}" drop constraint "{name}"')
+                if fmt == 'csv':
+                    counter = dict(rows=-1)
+                    def count(lines):
+                        for line in lines:
+                            counter['rows'] += 1
+                            yield line
+                    copy_rows(cursor, table, count(lines), csv=True)
+                else:
+                    # 列名取自第一条 INSERT
+                    counter = dict(rows=0, columns=None)
+                    rows = _parse_inserts(lines, counter)
+                    first = next(rows, None)
+                    if first is not None:
+                        copy_rows(cursor, table, _chain(first, rows), counter['columns'])
+            for _, definition in indexes:
+                cursor.execute(definition)
+            for name, definition in constraints:
+                cursor.execute(f'alter table "{table}" add constraint "{name}" {definition}')
+            reset_sequence(cursor, table)
+            connection.commit()
+            cursor.execute(f'analyze "{table}"')
+            connection.commit()
+            seconds = time.perf_counter() - begin
+            rows = max(counter['rows'], 0)
+            result[table] = rows, seconds
+            print(f'{table}: {rows} rows in {seconds:.2f}s ({rows/seconds:.0f} rows/s)')
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return result
+
+
+def reset_sequence(cursor, table):
+    '''显式写入 id 后，把 serial 序列推进到 max(id)
+    Argument:
+        - cursor: DB-API cursor
+        - table: str, 没有 serial 类型 id 列的表不处理
+    '''
+    cursor.execute('''
+        select pg_get_serial_sequence(%s, column_name) from information_schema.columns
+        where table_schema=current_schema and table_name=%s and column_name='id'
+    ''', (f'"{table}"', table))
+    row = cursor.fetchone()
+    if row is not None and row[0] is not None:
+        cursor.execute(f'select setval(%s, coalesce(max(id), 0)+1, false) from "{table}"', row)
+
+
+def _chain(first, rows):
+    yield first
+    yield from rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='COPY 批量导入时刻表数据')
+    parser.add_argument('source', help='sql.7z 或包含 <table>.sql/<table>.csv 的目录')
+    parser.add_argument('--tables', nargs='+', default=tables)
+    parser.add_argument('--schema', default=None, help='先执行的建表脚本，如 data/main.sql')
+    args = parser.parse_args()
+    load(args.source, args.tables, args.schema)
@@ -1,5 +1,5 @@
-__all__ = ('Train', 'load_stations', 'load_trains')
+__all__ = ('Train', 'load_stations', 'load_trains', 'load_stations_columns', 'load_trains_columns')
 
 
 from .models import Train
-from .utils import load_stations, load_trains
+from .utils import load_stations, load_stations_columns, load_trains, load_trains_columns
@@ -0,0 +1,132 @@
+__all__ = ('ResponseCache', )
+
+
+import collections
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+from .config import cache_disk_ttl, cache_path, cache_size
+
+
+class ResponseCache:
+    '''按请求参数缓存接口结果：内存 LRU + TTL，可选磁盘层
+
+    Argument:
+        - maxsize: int, 内存中最多缓存的条目数
+        - path: str or NoneType, 磁盘缓存目录，None 表示只用内存
+        - disk_ttl: int, TTL 不小于该值（秒）的条目才写入磁盘
+
+    Note:
+        - 磁盘文件的修改时间设为过期时间，读取到过期文件或写入时删除已过期的文件
+
+    Example:
+        >>> c = ResponseCache(maxsize=128)
+        >>> c.set('stop_overs', dict(to='成都'), value, ttl=60)
+        >>> c.get('stop_overs', dict(to='成都'))
+    '''
+    def __init__(self, maxsize=cache_size, path=cache_path, disk_ttl=cache_disk_ttl):
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._path = path
+        self._disk_ttl = disk_ttl
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def get(self, endpoint, params, default=None):
+        key = self._key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._data.move_to_end(key)
+                    return item[1]
+                del self._data[key]
+        item = self._load(key)
+        if item is None:
+            return default
+        if item[0] <= now:
+            self._remove(self._file(key))
+            return default
+        self._put(key, item)
+        return item[1]
+
+    def set(self, endpoint, params, value, ttl):
+        key = self._key(endpoint, params)
+        item = time.time() + ttl, value
+        self._put(key, item)
+        if ttl >= self._disk_ttl:
+            self._dump(key, item)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self._path is not None:
+            for name in os.listdir(self._path):
+                if name.endswith('.pkl'):
+                    self._remove(os.path.join(self._path, name))
+
+    def prune(self):
+        '''删除磁盘上已过期的条目
+
+        Return:
+            - int, 删除的文件数
+        '''
+        if self._path is None:
+            return 0
+        now, count = time.time(), 0
+        for name in os.listdir(self._path):
+            path = os.path.join(self._path, name)
+            try:
+                expired = name.endswith('.pkl') and os.stat(path).st_mtime <= now
+            except OSError:
+                continue
+            if expired:
+                count += self._remove(path)
+        return count
+
+    def _put(self, key, item):
+        with self._lock:
+            self._data[key] = item
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def _load(self, key):
+        if self._path is None:
+            return None
+        try:
+            with open(self._file(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _dump(self, key, item):
+        if self._path is None:
+            return
+        path = self._file(key)
+        with open(path+'.tmp', 'wb') as f:
+            pickle.dump(item, f)
+        os.utime(path+'.tmp', (item[0], item[0]))
+        os.replace(path+'.tmp', path)
+        self.prune()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _file(self, key):
+        return os.path.join(self._path, hashlib.sha1(key.encode()).hexdigest()+'.pkl')
+
+    @staticmethod
+    def _key(endpoint, params):
+        return endpoint + json.dumps(params, sort_keys=True, ensure_ascii=False)
@@ -0,0 +1,76 @@
+__all__ = ('Client', 'RateLimiter')
+
+
+import collections
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from .config import backoff, rate_limit, retries, timeout, workers
+
+
+class RateLimiter:
+    '''按主机限速，每秒最多 rate 个请求（rate 为 0 时不限速）
+    '''
+    def __init__(self, rate=rate_limit):
+        self._interval = 1 / rate if rate else 0
+        self._next = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next[host])
+            self._next[host] = start + self._interval
+        if start > now:
+            time.sleep(start-now)
+
+
+class Client:
+    '''复用连接（keep-alive）的 HTTP 客户端，带并发上限、限速与指数退避重试
+
+    Example:
+        >>> c = Client(workers=4, rate=2)
+        >>> c.map(lambda x: c.get(url, params=x), params)
+    '''
+    def __init__(self, workers=workers, rate=rate_limit, retries=retries, backoff=backoff, timeout=timeout):
+        import requests
+
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=retries, backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._limiter = RateLimiter(rate)
+        self._workers = workers
+        self._timeout = timeout
+
+    def get(self, url, params=None):
+        '''
+        Return:
+            - dict, 响应 JSON
+        '''
+        self._limiter.wait(urlsplit(url).netloc)
+        response = self._session.get(url, params=params, timeout=self._timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def map(self, function, iterable):
+        '''并发执行，结果顺序与输入一致
+
+        Return:
+            - list
+        '''
+        with ThreadPoolExecutor(self._workers) as executor:
+            return list(executor.map(function, iterable))
+
+    def close(self):
+        self._session.close()
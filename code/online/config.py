@@ -1,4 +1,8 @@
-__all__ = ('constid_path', 'station_path', 'train_path')
+__all__ = (
+    'constid_path', 'station_path', 'train_path',
+    'workers', 'rate_limit', 'retries', 'backoff', 'timeout',
+    'cache_path', 'cache_size', 'cache_ttls', 'cache_disk_ttl',
+)
 
 
 import os
@@ -12,5 +16,22 @@ def same_dir(path, *p):
 
 
 constid_path = same_dir(__file__, 'constid.txt')
-station_path = same_dir(__file__, 'data', 'stations.csv')
-train_path = same_dir(__file__, 'data', 'trains.csv')
+station_path = same_dir(__file__, 'data', 'stations')  # columnar directory (stations.csv is converted), or a .csv file
+train_path = same_dir(__file__, 'data', 'trains')
+cache_path = same_dir(__file__, 'data', 'cache', '')  # None for memory only
+
+# http client configuration
+workers = 8
+rate_limit = 5  # requests per second per host, 0 for unlimited
+retries = 3
+backoff = 0.5  # seconds, doubled on each retry
+timeout = 10
+
+# response cache configuration
+cache_size = 1024
+cache_disk_ttl = 60 * 60  # seconds, entries with a shorter ttl are kept in memory only
+cache_ttls = {  # seconds
+    'stations': 7 * 24 * 60 * 60,
+    'remainder_tickets': 60,
+    'stop_overs': 24 * 60 * 60,
+}
@@ -0,0 +1 @@
+var station_names ='@bjb|北京北|VAP|beijingbei|bjb|0@bjd|北京东|BOP|beijingdong|bjd|1@bji|北京|BJP|beijing|bj|2@bjn|北京南|VNP|beijingnan|bjn|3@bjx|北京西|BXP|beijingxi|bjx|4@sha|上海|SHH|shanghai|sh|5@shq|上海虹桥|AOH|shanghaihongqiao|shhq|6@szb|深圳北|IOQ|shenzhenbei|szb|7@cdd|成都东|ICW|chengdudong|cdd|8@lch|利川|LCN|lichuan|lc|9@syb|沈阳|SYT|shenyang|sy|10@kmi|昆明|KMM|kunming|km|11@hbx|哈尔滨西|VAB|haerbinxi|hebx|12';
\ No newline at end of file
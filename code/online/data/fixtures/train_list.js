@@ -0,0 +1 @@
+var train_list ={"2020-05-20":{"D":[{"station_train_code":"D1(北京-沈阳)","train_no":"24000000D10R"},{"station_train_code":"D2(沈阳-北京)","train_no":"0b00000000D20"},{"station_train_code":"D2241(成都东-深圳北)","train_no":"76000D22410C"}],"G":[{"station_train_code":"G1311(利川-深圳北)","train_no":"6i000G131100"},{"station_train_code":"G1314(利川-深圳北)","train_no":"6i000G131400"},{"station_train_code":"G101(北京南-上海虹桥)","train_no":"24000000G10I"}],"K":[{"station_train_code":"K1(上海-昆明)","train_no":"5l0000K10040"}],"Z":[{"station_train_code":"Z16(哈尔滨西-北京)","train_no":"01000000Z160"}]},"2020-05-21":{"D":[{"station_train_code":"D1(北京-沈阳)","train_no":"24000000D10R"},{"station_train_code":"D2(沈阳-北京)","train_no":"0b00000000D20"},{"station_train_code":"D2241(成都东-深圳北)","train_no":"76000D22410C"}],"G":[{"station_train_code":"G1311(利川-深圳北)","train_no":"6i000G131100"},{"station_train_code":"G1314(利川-深圳北)","train_no":"6i000G131400"},{"station_train_code":"G101(北京南-上海虹桥)","train_no":"24000000G10I"}],"K":[{"station_train_code":"K1(上海-昆明)","train_no":"5l0000K10040"}],"Z":[{"station_train_code":"Z16(哈尔滨西-北京)","train_no":"01000000Z160"}]},"2020-05-22":{"D":[{"station_train_code":"D1(北京-沈阳)","train_no":"24000000D10R"},{"station_train_code":"D2(沈阳-北京)","train_no":"0b00000000D20"},{"station_train_code":"D2241(成都东-深圳北)","train_no":"76000D22410C"}],"G":[{"station_train_code":"G1311(利川-深圳北)","train_no":"6i000G131100"},{"station_train_code":"G1314(利川-深圳北)","train_no":"6i000G131400"},{"station_train_code":"G101(北京南-上海虹桥)","train_no":"24000000G10I"}],"K":[{"station_train_code":"K1(上海-昆明)","train_no":"5l0000K10040"}],"Z":[{"station_train_code":"Z16(哈尔滨西-北京)","train_no":"01000000Z160"}]}};
\ No newline at end of file
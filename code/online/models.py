@@ -4,10 +4,11 @@ __all__ = ('Train', )
 
 import collections
 import json
-import requests
 import time
 
-from .config import constid_path
+from .cache import ResponseCache
+from .client import Client
+from .config import cache_ttls, constid_path
 from .utils import lazy_property
 
 
@@ -29,23 +30,29 @@ class Train:
     '''同程旅游火车票模型
     '''
 
-    def __init__(self, browser='Firefox'):
+    def __init__(self, browser='Firefox', client=None, cache=None):
         with open(constid_path, 'r') as f:
             self._constid = f.read().strip()
         self._browser = browser
+        self._client = Client() if client is None else client
+        self._cache = ResponseCache() if cache is None else cache
 
 
     @lazy_property
     def stations(self):
         '''返回所有的城市（火车站）
         '''
+        return self._cached('stations', dict(), self._stations)
+
+
+    def _stations(self):
         url = 'https://www.ly.com/uniontrain/trainapi/TrainPCCommon/GetAllCity'
         params = dict(
             headct=0, platId=1, headver='1.0.0', headtime=self.headtime, memberId=0,
         )
         result = dict()
-        response = requests.get(url, params=dict(para=json.dumps(params)))
-        for city, data in response.json()['data'].items():
+        response = self._client.get(url, params=dict(para=json.dumps(params)))
+        for city, data in response['data'].items():
             h, p, q = data['hot'], data['priority'], data['quanpin']
             result[city.replace(' ', '')] = Station(h, p, data['match'].split('|'), q)
         return result
@@ -63,6 +70,11 @@ class Train:
             >>> t = Train()
             >>> t.remainder_tickets('北京西', '济南东', '2020-05-04')
         '''
+        params = dict(from_=from_, to=to, date=date, sort_by=sort_by)
+        return self._cached('remainder_tickets', params, self._remainder_tickets, **params)
+
+
+    def _remainder_tickets(self, from_, to, date, sort_by):
         def yield_tickets(data):
             fc, tc = data['fromCityName'], data['toCityName']
             date = data['trainDate']
@@ -86,8 +98,21 @@ class Train:
             PassType='', TrainClass='', FromTimeSlot='', ToTimeSlot='', FromStation='',
             ToStation='', callback='', tag='',
         )
-        response = requests.get(url, params=dict(para=json.dumps(params)))
-        return tuple(yield_tickets(response.json()['data']))
+        response = self._client.get(url, params=dict(para=json.dumps(params)))
+        return tuple(yield_tickets(response['data']))
+
+
+    def remainder_tickets_many(self, queries, sort_by='fromTime'):
+        '''批量余票信息（并发）
+
+        Argument:
+            - queries: iteration[tuple[from_, to, date]]
+
+        Example:
+            >>> t = Train()
+            >>> t.remainder_tickets_many([('北京西', '济南东', '2020-05-04'), ('北京', '上海', '2020-05-04')])
+        '''
+        return self._client.map(lambda x: self.remainder_tickets(*x, sort_by=sort_by), queries)
 
 
     def stop_overs(self, from_, to, train_num, date):
@@ -97,6 +122,11 @@ class Train:
             >>> t = Train()
             >>> t.stop_overs('北京', '成都', 'G89', '2020-05-23')
         '''
+        params = dict(from_=from_, to=to, train_num=train_num, date=date)
+        return self._cached('stop_overs', params, self._stop_overs, **params)
+
+
+    def _stop_overs(self, from_, to, train_num, date):
         def yield_stop_overs(data):
             for station in data:
                 keys = ('stationName', 'startTime', 'endTime', 'overTime')
@@ -107,11 +137,30 @@ class Train:
             'from': from_, 'to': to, 'trainnum': train_num, 'querydate': date.replace('-', ''),
             'headct': 0, 'platId': 1, 'headver': '1.0.0', 'headtime': self.headtime, 'memberId': 0,
         }
-        response = requests.get(url, params=dict(para=json.dumps(params)))
-        data = response.json()['data']['stopOvers']  # ['stopOvers', 'depStatNo', 'arrStatNo']
+        response = self._client.get(url, params=dict(para=json.dumps(params)))
+        data = response['data']['stopOvers']  # ['stopOvers', 'depStatNo', 'arrStatNo']
         return tuple(yield_stop_overs(data))
 
 
+    def stop_overs_many(self, queries):
+        '''批量中转站信息（并发）
+
+        Argument:
+            - queries: iteration[tuple[from_, to, train_num, date]]
+        '''
+        return self._client.map(lambda x: self.stop_overs(*x), queries)
+
+
+    def _cached(self, endpoint, params, function, **kwargs):
+        '''按规范化后的请求参数查缓存，未命中时请求并按 cache_ttls[endpoint] 缓存
+        '''
+        value = self._cache.get(endpoint, params)
+        if value is None:
+            value = function(**kwargs)
+            self._cache.set(endpoint, params, value, cache_ttls[endpoint])
+        return value
+
+
     def update_constid(self):
         from selenium import webdriver
 
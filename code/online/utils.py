@@ -1,11 +1,17 @@
-__all__ = ('lazy_property', 'load_stations', 'load_trains')
+__all__ = (
+    'lazy_property', 'Columns', 'iter_stations', 'iter_trains',
+    'load_stations', 'load_trains', 'load_stations_columns', 'load_trains_columns',
+)
 
 
+import codecs
 import json
 import os
-import pandas as pd
 import re
-import requests
+
+from array import array
+from collections.abc import Mapping
+from warnings import warn
 
 from .config import station_path, train_path
 
@@ -40,52 +46,254 @@ def lazy_property(func):
     return lazy
 
 
-def load_stations(path=station_path, update=False):
+class Columns(Mapping):
+    '''列存储的读取结果：列名 -> pandas.Categorical，首次访问某列时构建
+
+    Note:
+        - 下标按 pandas 使用的整数类型存储，Categorical 直接引用内存映射的下标，不复制；
+          to_frame() 构建 DataFrame 时 pandas 可能复制
+    '''
+    def __init__(self, headers, columns):
+        self._columns = dict(zip(headers, columns))
+        self._categoricals = dict()
+
+    def __getitem__(self, name):
+        if name not in self._categoricals:
+            import pandas as pd
+
+            categories, codes = self._columns[name]
+            self._categoricals[name] = pd.Categorical.from_codes(codes, categories)
+        return self._categoricals[name]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    @property
+    def rows(self):
+        return len(next(iter(self._columns.values()))[1]) if self._columns else 0
+
+    def categories(self, name):
+        '''
+        Return:
+            - numpy.ndarray[str], 取值
+        '''
+        return self._columns[name][0]
+
+    def codes(self, name):
+        '''
+        Return:
+            - numpy.ndarray[int] or numpy.memmap, 下标
+        '''
+        return self._columns[name][1]
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: self[name] for name in self})
+
+
+def iter_stations(chunks):
+    '''逐块解析 station_name.js，按行产生 (拼音码, 站名, 电报码, 拼音, 首字母)
+
+    Argument:
+        - chunks: iteration[bytes or str], 如 response.iter_content()、按块读取的本地文件
+    '''
+    buffer = ''
+    for text in _decode(chunks):
+        *lines, buffer = (buffer+text).split('@')
+        for line in lines:
+            if '|' in line:
+                yield tuple(line.split('|')[:5])
+    line = buffer.split("'")[0]
+    if '|' in line:
+        yield tuple(line.split('|')[:5])
+
+
+def iter_trains(chunks):
+    '''逐块解析 train_list.js，按行产生 (时间, 类型, 列车编号, 车次, 起点, 终点)
+
+    Argument:
+        - chunks: iteration[bytes or str], 如 response.iter_content()、按块读取的本地文件
+    Note:
+        - 文件结构为 {时间: {类型: [{station_train_code, train_no}, ...]}}，只保留未解析完的尾部
+    '''
+    buffer, time, kind = '', None, None
+    for text in _decode(chunks):
+        buffer += text
+        end = 0
+        for match in _token.finditer(buffer):
+            key, bracket, leaf = match.groups()
+            if leaf is not None:
+                val = json.loads(leaf)
+                yield (time, kind, val['train_no'], *_train_code.findall(val['station_train_code']))
+            elif bracket == '{':
+                time = key
+            else:
+                kind = key
+            end = match.end()
+        buffer = buffer[end:]
+
+
+def load_stations(path=station_path, update=False, download=True):
     '''从 12306 下载车站信息
 
     Argument:
-        - path: str, NoneType
+        - path: str, NoneType, 以 .csv 结尾时读写 CSV，否则为列存储目录
         - update: bool
+        - download: bool, False 时只读本地缓存，没有缓存返回 None
+    Return:
+        - pandas.DataFrame, 列：拼音码、站名、电报码、拼音、首字母
     '''
-    if not update and isinstance(path, str) and os.path.exists(path):
-        return pd.read_csv(path, index_col=None)
-    else:
-        url = 'https://kyfw.12306.cn/otn/resources/js/framework/station_name.js'
-        headers = ['拼音码', '站名', '电报码', '拼音', '首字母', 'ID']
-        text = requests.get(url).text
-        lines= text[text.index("'")+1: text.rindex("'")]
-        data = tuple(line.split('|') for line in lines.split('@') if line)
-        df = pd.DataFrame(data, columns=headers)
-        del df['ID']
-        if isinstance(path, str):
-            df.to_csv(path, index=False)
-        return df
+    return _frame(_load(path, update, download, *_stations))
 
 
-def load_trains(path=train_path, update=False):
+def load_trains(path=train_path, update=False, download=True):
     '''从 12306 下载车次信息
 
     Argument:
-        - path: str, NoneType
+        - path: str, NoneType, 以 .csv 结尾时读写 CSV，否则为列存储目录
         - update: bool
+        - download: bool, False 时只读本地缓存，没有缓存返回 None
+    Return:
+        - pandas.DataFrame, 列：时间、类型、列车编号、车次、起点、终点
+    '''
+    return _frame(_load(path, update, download, *_trains))
+
+
+def load_stations_columns(path=station_path, update=False, download=True):
+    '''同 load_stations，不构建 DataFrame
+
+    Argument:
+        - path: str, NoneType, 列存储目录
+    Return:
+        - Columns
+    '''
+    assert not (isinstance(path, str) and path.endswith('.csv')), f'Not a column store: {path}'
+    return _load(path, update, download, *_stations)
+
+
+def load_trains_columns(path=train_path, update=False, download=True):
+    '''同 load_trains，不构建 DataFrame
+
+    Argument:
+        - path: str, NoneType, 列存储目录
+    Return:
+        - Columns
+    '''
+    assert not (isinstance(path, str) and path.endswith('.csv')), f'Not a column store: {path}'
+    return _load(path, update, download, *_trains)
+
+
+_stations = (
+    ['拼音码', '站名', '电报码', '拼音', '首字母'],
+    'https://kyfw.12306.cn/otn/resources/js/framework/station_name.js', iter_stations,
+)
+_trains = (
+    ['时间', '类型', '列车编号', '车次', '起点', '终点'],
+    'https://kyfw.12306.cn/otn/resources/js/query/train_list.js', iter_trains,
+)
+
+
+_token = re.compile(r'"([^"]*)"\s*:\s*([{\[])|(\{[^{}]*\})')
+_train_code = re.compile(r'[^()-]+')
+
+
+def _frame(columns):
+    return columns.to_frame() if isinstance(columns, Columns) else columns
+
+
+def _decode(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield chunk if isinstance(chunk, str) else decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _load(path, update, download, headers, url, parse):
+    '''
+    Note:
+        - 列存储：每列按取值字典编码，i.values.npy 为取值，i.codes.npy 为下标，
+          columns.json 最后写入；读取时下标以内存映射打开
+        - 列存储目录不存在而同名的 .csv（旧版本的缓存）存在时转换为列存储
     '''
-    def iterrows(data):
-        # ('时间', '类型', '列车编号', '车次', '起点', '终点')
-        pattern = re.compile(r'[^()-]+')
-        for time, subdata in data.items():
-            for key, vals in subdata.items():
-                for val in vals:
-                    x = pattern.findall(val['station_train_code'])
-                    yield time, key, val['train_no'], *x
-
-    if not update and isinstance(path, str) and os.path.exists(path):
-        return pd.read_csv(path, index_col=None)
-    else:
-        url = 'https://kyfw.12306.cn/otn/resources/js/query/train_list.js'
-        headers = ['时间', '类型', '列车编号', '车次', '起点', '终点']
-        text = requests.get(url).text
-        data = json.loads(text[text.index('{'): text.rindex('}')+1])
-        df =  pd.DataFrame(tuple(iterrows(data)), columns=headers)
-        if isinstance(path, str):
-            df.to_csv(path, index=False)
+    import pandas as pd
+
+    csv = isinstance(path, str) and path.endswith('.csv')
+    if not update and isinstance(path, str):
+        if csv and os.path.exists(path):
+            return pd.read_csv(path, index_col=None)
+        if not csv and os.path.exists(os.path.join(path, 'columns.json')):
+            return _read_columns(path)
+        if not csv and os.path.exists(path+'.csv'):
+            warn(f'Converting {path}.csv to columns in {path}')
+            rows = pd.read_csv(path+'.csv', index_col=None, dtype=str).itertuples(index=False)
+            _write_columns(path, headers, _encode(headers, rows))
+            return _read_columns(path)
+    if not download:
+        return None
+    import requests
+
+    with requests.get(url, stream=True) as response:
+        columns = _encode(headers, parse(response.iter_content(chunk_size=1<<16)))
+    if csv:
+        df = Columns(headers, columns).to_frame()
+        df.to_csv(path, index=False)
         return df
+    if isinstance(path, str):
+        _write_columns(path, headers, columns)
+        return _read_columns(path)
+    return Columns(headers, columns)
+
+
+def _encode(headers, rows):
+    '''
+    Note:
+        - 下标的整数类型与 pandas 按取值个数选择的一致（int8、int16、int32、int64），构建 Categorical 时不复制
+    '''
+    import numpy as np
+
+    values = [dict() for _ in headers]
+    codes = [array('i') for _ in headers]
+    for row in rows:
+        for value, code, x in zip(values, codes, row):
+            code.append(value.setdefault(x, len(value)))
+    return [
+        (np.array(list(value), dtype=str), np.frombuffer(code, dtype=np.int32).astype(_code_type(len(value))))
+        for value, code in zip(values, codes)
+    ]
+
+
+def _code_type(size):
+    import numpy as np
+
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _write_columns(path, headers, columns):
+    import numpy as np
+
+    os.makedirs(path, exist_ok=True)
+    for ith, (values, codes) in enumerate(columns):
+        np.save(os.path.join(path, f'{ith}.values.npy'), values)
+        np.save(os.path.join(path, f'{ith}.codes.npy'), codes)
+    with open(os.path.join(path, 'columns.json'), 'w', encoding='utf-8') as f:
+        json.dump(headers, f, ensure_ascii=False)
+
+
+def _read_columns(path):
+    import numpy as np
+
+    with open(os.path.join(path, 'columns.json'), 'r', encoding='utf-8') as f:
+        headers = json.load(f)
+    columns = [
+        (np.load(os.path.join(path, f'{ith}.values.npy')),
+            np.load(os.path.join(path, f'{ith}.codes.npy'), mmap_mode='r'))
+        for ith in range(len(headers))
+    ]
+    return Columns(headers, columns)
@@ -0,0 +1,90 @@
+'''密码哈希：方法与强度见 config.py，可放到进程池中计算
+
+Example:
+    python -m code.password  # 每核每秒可处理的登录次数
+'''
+__all__ = ('hash_password', 'verify_password', 'needs_rehash')
+
+
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    from .config import password_length, password_method, password_salt_length, password_workers
+except:
+    from config import password_length, password_method, password_salt_length, password_workers
+
+
+_executor = None
+
+
+def _submit(function, *args):
+    '''password_workers 为 0 时在当前线程计算，否则交给进程池（等待期间不占用 GIL）
+    '''
+    global _executor
+    if not password_workers:
+        return function(*args)
+    if _executor is None:
+        _executor = ProcessPoolExecutor(password_workers)
+    return _executor.submit(function, *args).result()
+
+
+def _hash(password):
+    pwhash = generate_password_hash(password, method=password_method, salt_length=password_salt_length)
+    if len(pwhash) > password_length:
+        raise ValueError(
+            f'{password_method} hashes are {len(pwhash)} characters, longer than the password column '
+            f'({password_length}); widen it (see data/password.sql) and raise config.password_length'
+        )
+    return pwhash
+
+
+def hash_password(password):
+    '''
+    Argument:
+        - password: str
+    Return:
+        - str, method$salt$hash
+    '''
+    return _submit(_hash, password)
+
+
+def verify_password(pwhash, password):
+    '''
+    Argument:
+        - pwhash: str
+        - password: str
+    Return:
+        - bool
+    '''
+    return _submit(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    '''已存储的哈希方法或强度与 config.password_method 不同
+    '''
+    return pwhash.split('$', 1)[0] != password_method
+
+
+def benchmark(seconds=5, workers=None):
+    '''
+    Return:
+        - tuple[float, float], (每秒登录次数, 每核每秒登录次数)
+    '''
+    workers = workers or os.cpu_count()
+    pwhash = _hash('benchmark')
+    count, begin = 0, time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        while time.perf_counter()-begin < seconds:
+            count += sum(executor.map(check_password_hash, [pwhash]*workers, ['benchmark']*workers))
+    rate = count / (time.perf_counter()-begin)
+    return rate, rate/workers
+
+
+if __name__ == '__main__':
+    rate, per_core = benchmark()
+    print(f'{password_method}: {rate:.1f} logins/s, {per_core:.1f} logins/s/core')
@@ -0,0 +1,172 @@
+__all__ = ('QueryProfiler', 'QueryBudgetWarning')
+
+
+import collections
+import functools
+import inspect
+import sys
+import threading
+import time
+
+from warnings import warn
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetWarning(UserWarning):
+    '''单次调用的 SQL 语句数超出预算（疑似 N+1 查询）
+    '''
+
+
+class QueryProfiler:
+    '''把 SQL 语句条数、耗时及返回行数归到调用它的 utils 方法上
+
+    Argument:
+        - budget: int, 单次（最外层）调用允许的语句数，0 表示不检查
+        - enabled: bool, False 时直接调用原函数
+
+    Note:
+        - 嵌套调用的统计是包含式的：get._by 的语句同时计入调用它的方法
+        - 只对最外层调用检查预算，避免同一次调用重复告警
+        - 告警指向调用被跟踪方法的代码（跳过本模块的帧）
+
+    Example:
+        >>> profiler = QueryProfiler(20)
+        >>> profiler.attach()
+        >>> @profiler.instrument
+        ... class get: ...
+        >>> profiler.summary()['get.stations']['queries']
+    '''
+    def __init__(self, budget, enabled=True):
+        self.budget = budget
+        self.enabled = enabled
+        self.calls = collections.Counter()
+        self.queries = collections.Counter()
+        self.seconds = collections.Counter()
+        self.rows = collections.Counter()
+        self.peaks = collections.Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def attach(self, target=Engine):
+        '''监听 target（默认所有 Engine）上执行的语句
+        '''
+        event.listen(target, 'before_cursor_execute', self._before)
+        event.listen(target, 'after_cursor_execute', self._after)
+        event.listen(target, 'handle_error', self._error)
+
+    def detach(self, target=Engine):
+        event.remove(target, 'before_cursor_execute', self._before)
+        event.remove(target, 'after_cursor_execute', self._after)
+        event.remove(target, 'handle_error', self._error)
+
+    def instrument(self, cls):
+        '''类装饰器：跟踪类中所有公开（不以 _ 开头）的 classmethod，名称为 <类名>.<方法名>
+
+        Note:
+            - 私有辅助方法（如 get._by）的语句计入调用它的公开方法
+        '''
+        for name, attribute in list(vars(cls).items()):
+            if isinstance(attribute, classmethod) and not name.startswith('_'):
+                function = self.track(f'{cls.__name__}.{name}')(attribute.__func__)
+                setattr(cls, name, classmethod(function))
+        return cls
+
+    def track(self, name):
+        '''生成器函数只在其恢复执行期间计数，统计在生成器结束时记录
+        '''
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                frames, frame = self._frames(), [0, 0.0, 0]  # queries, seconds, rows
+                frames.append(frame)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    frames.pop()
+                    self._finish(name, frame, frames)
+
+            @functools.wraps(function)
+            def generator(*args, **kwargs):
+                if not self.enabled:
+                    return (yield from function(*args, **kwargs))
+                frames, frame = self._frames(), [0, 0.0, 0]
+                iterator = function(*args, **kwargs)
+                try:
+                    while True:
+                        frames.append(frame)
+                        try:
+                            value = next(iterator)
+                        except StopIteration as e:
+                            return e.value
+                        finally:
+                            frames.pop()
+                        yield value
+                finally:
+                    self._finish(name, frame, frames)
+
+            return generator if inspect.isgeneratorfunction(function) else wrapper
+        return decorator
+
+    def summary(self):
+        '''
+        Return:
+            - dict[str, dict], 方法名 -> 调用次数、语句数、单次最多语句数、秒、行数
+        '''
+        with self._lock:
+            return {
+                name: dict(
+                    calls=calls, queries=self.queries[name], max_queries=self.peaks[name],
+                    queries_per_call=self.queries[name]/calls, seconds=self.seconds[name],
+                    rows=self.rows[name],
+                )
+                for name, calls in self.calls.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            for counter in (self.calls, self.queries, self.seconds, self.rows, self.peaks):
+                counter.clear()
+
+    def _frames(self):
+        if not hasattr(self._local, 'frames'):
+            self._local.frames = list()
+        return self._local.frames
+
+    def _finish(self, name, frame, frames):
+        queries, seconds, rows = frame
+        with self._lock:
+            self.calls[name] += 1
+            self.queries[name] += queries
+            self.seconds[name] += seconds
+            self.rows[name] += rows
+            self.peaks[name] = max(self.peaks[name], queries)
+        if not frames and 0<self.budget<queries:
+            warn(f'{name} issued {queries} queries (budget {self.budget})', QueryBudgetWarning, stacklevel=self._stacklevel())
+
+    @staticmethod
+    def _stacklevel():
+        '''warn 在 _finish 中调用：跳过本模块的帧（_finish、wrapper 或 generator）
+        '''
+        level, frame = 2, sys._getframe(2)
+        while frame is not None and frame.f_globals.get('__name__') == __name__:
+            level, frame = level+1, frame.f_back
+        return level
+
+    def _before(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_start', list()).append(time.perf_counter())
+
+    def _after(self, connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info['query_start'].pop()
+        rows = max(cursor.rowcount, 0)
+        for frame in self._frames():
+            frame[0] += 1
+            frame[1] += seconds
+            frame[2] += rows
+
+    def _error(self, context):
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
@@ -0,0 +1,97 @@
+'''后台定时取消超时未支付的订单
+
+Example:
+    python -m code.sweeper
+    python -m code.sweeper --interval 30
+    python -m code.sweeper --once
+
+Note:
+    - 推荐作为单独的进程运行；config.is_sweeping 为 True 时 create_app 会在 Web 进程中启动 Sweeper，
+      多进程部署时每个进程各启动一个
+    - 每次取消了订单的清理以 INFO 级别记录到 logging 的 code.sweeper，没有取消时为 DEBUG
+'''
+__all__ = ('Sweeper', )
+
+
+import argparse
+import collections
+import logging
+import threading
+import time
+
+from warnings import warn
+
+try:
+    from .config import sweep_seconds
+    from .database import session
+    from .utils import update
+except:
+    from config import sweep_seconds
+    from database import session
+    from utils import update
+
+
+Sweep = collections.namedtuple('Sweep', ('expired', 'seconds'))
+logger = logging.getLogger(__name__)
+
+
+class Sweeper(threading.Thread):
+    '''后台定时取消超时未支付的订单
+
+    Example:
+        >>> sweeper = Sweeper(interval=60)
+        >>> sweeper.start()
+        >>> sweeper.last
+        Sweep(expired=3, seconds=0.0042)
+    '''
+    def __init__(self, interval=sweep_seconds):
+        super().__init__(name='order-sweeper', daemon=True)
+        self.interval = interval
+        self.last = None
+        self.expired = 0
+        self.sweeps = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                expired, seconds = self.sweep()
+            except Exception as e:
+                warn(f'Sweep fails: {e!r}')
+            else:
+                level = logging.INFO if expired else logging.DEBUG
+                logger.log(level, '%d orders expired in %.3fs', expired, seconds)
+
+    def sweep(self):
+        '''
+        Return:
+            - Sweep, 本次取消的订单数及耗时（秒）
+        '''
+        begin = time.perf_counter()
+        try:
+            expired = update.orders()
+        finally:
+            session.remove()
+        self.last = Sweep(expired, time.perf_counter()-begin)
+        self.expired += expired
+        self.sweeps += 1
+        return self.last
+
+    def stop(self):
+        self._stopped.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='定时取消超时未支付的订单')
+    parser.add_argument('--interval', type=float, default=sweep_seconds, help='间隔（秒）')
+    parser.add_argument('--once', action='store_true', help='只执行一次')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    sweeper = Sweeper(args.interval)
+    if args.once:
+        print(sweeper.sweep())
+    else:
+        try:
+            sweeper.run()
+        except KeyboardInterrupt:
+            print(f'{sweeper.expired} orders expired in {sweeper.sweeps} sweeps')
@@ -1,22 +1,44 @@
-from datetime import date
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from faker import Faker
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from random import choice, randint
+from urllib.parse import urlsplit
 
 try:
     from .database import (
         Admin, User, City, Order, Station, Journey, SeatType, Capacity, Ticket,
         session,
     )
-    from .utils import add
+    from .identity import id_card_validator
+    from .online import Train
+    from .online.cache import ResponseCache
+    from .online.client import Client
+    from .online.utils import _encode, _read_columns, _write_columns, iter_stations, iter_trains
+    from .utils import add, cache, delete, get, profiler, status
 except:
     from database import (
         Admin, User, City, Order, Station, Journey, SeatType, Capacity, Ticket,
         session,
     )
-    from utils import get, add, check, update, cache, delete
+    from identity import id_card_validator
+    from online import Train
+    from online.cache import ResponseCache
+    from online.client import Client
+    from online.utils import _encode, _read_columns, _write_columns, iter_stations, iter_trains
+    from utils import get, add, check, update, cache, delete, profiler, status
 
 
 F = Faker('zh')
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'online', 'data', 'fixtures')
 
 
 def add_random_user():
@@ -72,5 +94,261 @@ def add_random_order_and_ticket():
     return order, ticket
 
 
+def check_id_card_parity(number=10000):
+    '''随机身份证号（合法、校验位错误、日期非法、地址码不存在等）与数据库函数 is_id_valid 比对
+
+    Return:
+        - list[str], 结果不一致的号码
+    '''
+    def mutate(code):
+        i = randint(0, 17)
+        return code[:i] + choice('0123456789X') + code[i+1:]
+
+    codes = [F.ssn() for _ in range(number)]
+    codes += [mutate(code) for code in codes]
+    codes += [code[:17]+'x' for code in codes[:100]] + ['', '1'*18, '11010119000229001X', '110101'+'99991231'+'0011']
+    expected = dict(session.execute(
+        'select code, is_id_valid(code) from unnest(:codes) as code', {'codes': codes}
+    ).fetchall())
+    batch = id_card_validator.validate_many(codes)
+    return [
+        code for code, value in zip(codes, batch)
+        if not (expected[code] == value == id_card_validator.is_valid(code))
+    ]
+
+
+def stress_add_order(train_number, carriage_index=1, threads=32, bookings=256):
+    '''多线程并发自动选座，检查是否存在重复售出的座位
+
+    Argument:
+        - train_number: str
+        - carriage_index: int
+        - threads: int
+        - bookings: int, 订票次数，超过座位数的请求应失败
+    Return:
+        - tuple[int, int], (成功数, 失败数)
+    '''
+    def book(user_id):
+        try:
+            return add.order(
+                user_id, train_number, carriage_index, None, depart_date,
+                depart_station, arrive_station,
+            ).id
+        except Exception:
+            return None
+        finally:
+            session.remove()
+
+    depart_date = date.today() + timedelta(days=randint(3650, 36500))
+    journeys = get.journeys_by_train_number(train_number)
+    journeys.sort(key=lambda j: j.station_index)
+    depart_station = get._by(Station.name, id=journeys[0].station_id)[0]
+    arrive_station = get._by(Station.name, id=journeys[-1].station_id)[0]
+    total, = get._by(Capacity.seat_num, train_number=train_number, carriage_index=carriage_index)
+    user_ids = get._compress(get._by(User.id, all=True))
+    session.remove()
+    with ThreadPoolExecutor(threads) as executor:
+        ids = list(executor.map(book, (choice(user_ids) for _ in range(bookings))))
+    orders = [get._by(Order, id=id) for id in ids if id is not None]
+    seats = Counter(order.seat_num for order in orders)
+    assert all(v==1 for v in seats.values()), f'Double sold: {seats.most_common(3)}'
+    assert len(orders) == min(bookings, total)
+    for order in orders:
+        order.status = status.canceled.value
+    session.commit()
+    return len(orders), bookings - len(orders)
+
+
+def check_train_readd(train_number='G1314'):
+    '''删除、重新添加、再次删除车次，不应违反 journey 的 (train_number, station_index) 唯一约束；最后恢复车次
+
+    Return:
+        - bool, 恢复后的停靠站与原来一致
+    '''
+    def snapshot():
+        journeys = sorted(get.journeys_by_train_number(train_number), key=lambda j: j.station_index)
+        return [
+            (names[j.station_id], j.arrive_time, j.depart_time, j.arrive_day, j.depart_day, j.distance)
+            for j in journeys
+        ]
+
+    names = dict(session.query(Station.id, Station.name))
+    stops = snapshot()
+    capacities = get._by(Capacity, train_number=train_number, is_valid=True, all=True)
+    carriages = [(c.seat_type, c.seat_num) for c in sorted(capacities, key=lambda c: c.carriage_index)]
+    trains = {train_number: (carriages, stops)}
+    delete.train(train_number)
+    add.trains(trains)
+    delete.train(train_number)
+    add.trains(trains)
+    return snapshot() == stops
+
+
+def check_online_parsers(chunk_size=7):
+    '''按块解析 fixtures 中的 train_list.js、station_name.js，与整体 json.loads 的结果比对；
+    再写入列存储，检查读取时下标为内存映射且 Categorical 不复制下标
+
+    Return:
+        - tuple[int, int], (车次行数, 车站行数)
+    '''
+    import numpy as np
+
+    def chunks(name):
+        with open(os.path.join(fixtures, name), 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+
+    def read(name):
+        with open(os.path.join(fixtures, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    text = read('train_list.js')
+    data = json.loads(text[text.index('{'): text.rindex('}')+1])
+    trains = list(iter_trains(chunks('train_list.js')))
+    assert trains == [
+        (time, kind, val['train_no'], *re.findall(r'[^()-]+', val['station_train_code']))
+        for time, subdata in data.items() for kind, vals in subdata.items() for val in vals
+    ]
+    text = read('station_name.js')
+    stations = list(iter_stations(chunks('station_name.js')))
+    assert stations == [
+        tuple(line.split('|')[:5]) for line in text[text.index("'")+1: text.rindex("'")].split('@') if line
+    ]
+    headers = ['时间', '类型', '列车编号', '车次', '起点', '终点']
+    with tempfile.TemporaryDirectory() as path:
+        _write_columns(path, headers, _encode(headers, trains))
+        columns = _read_columns(path)
+        assert list(zip(*(columns[name] for name in headers))) == trains
+        for name in headers:
+            assert isinstance(columns.codes(name), np.memmap), name
+            assert np.shares_memory(columns[name].codes, columns.codes(name)), name
+        del columns
+    return len(trains), len(stations)
+
+
+class _Replay(BaseHTTPRequestHandler):
+    '''按路径回放 fixtures 中录制的 JSON；/flaky/<n> 前 n 次返回 503，/down 总是返回 503
+    '''
+    protocol_version = 'HTTP/1.1'
+    routes = {
+        '/uniontrain/trainapi/Station/GetStopOvers': 'stop_overs.json',
+        '/uniontrain/trainapi/TrainPCCommon/SearchTrainRemainderTickets': 'remainder_tickets.json',
+    }
+
+    def do_GET(self):
+        server, path = self.server, urlsplit(self.path).path
+        with server.lock:
+            server.requests.append((path, time.monotonic(), self.client_address[1]))
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            count = sum(1 for p, *_ in server.requests if p == path)
+        try:
+            time.sleep(server.delay)
+            if path == '/down' or (path.startswith('/flaky/') and count <= int(path.split('/')[-1])):
+                self._send(503, b'{}')
+            elif path.startswith('/flaky/'):
+                self._send(200, b'{}')
+            elif path in self.routes:
+                with open(os.path.join(fixtures, self.routes[path]), 'rb') as f:
+                    self._send(200, f.read())
+            else:
+                self._send(404, b'{}')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check_online_client(workers=4, rate=10, retries=3, delay=0.05):
+    '''在本地回放服务器上检查 online.Client：*_many 并发批量请求及连接复用、5xx 重试、按主机限速
+
+    Return:
+        - dict, 各项检查的统计
+    '''
+    import requests
+
+    class Local(Client):
+        def get(self, url, params=None):
+            return super().get(base+urlsplit(url).path, params)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Replay)
+    server.lock, server.requests, server.active, server.peak, server.delay = threading.Lock(), [], 0, 0, delay
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    result = dict()
+    try:
+        # 批量：结果顺序与输入一致，并发不超过 workers，连接复用
+        client = Local(workers=workers, rate=0, retries=retries, backoff=0)
+        train = Train(client=client, cache=ResponseCache(path=None))
+        queries = [('北京', '成都', f'G{i}', '2020-05-23') for i in range(3*workers)]
+        stop_overs = train.stop_overs_many(queries)
+        assert len(stop_overs) == len(queries) and all(s == stop_overs[0] for s in stop_overs)
+        assert [s.name for s in stop_overs[0]] == ['北京西', '石家庄', '郑州东', '成都东']
+        tickets = train.remainder_tickets_many([('北京', '济南', '2020-05-04')]*2)
+        assert [t.train_number for t in tickets[0]] == ['G101', 'G5'] and tickets[0][0].seats[0].price == 184.5
+        ports = {port for *_, port in server.requests}
+        assert 1 < server.peak <= workers, server.peak
+        assert len(ports) <= workers, ports
+        result['batch'] = dict(requests=len(server.requests), peak=server.peak, connections=len(ports))
+        # 重试：503 重试后成功，次数用尽时抛出异常，404 不重试
+        server.requests.clear()
+        assert client.get(f'{base}/flaky/{retries-1}') == dict()
+        assert len(server.requests) == retries
+        try:
+            client.get(f'{base}/down')
+            raise AssertionError('retries were not exhausted')
+        except requests.exceptions.RetryError:
+            pass
+        assert sum(1 for p, *_ in server.requests if p == '/down') == retries+1
+        try:
+            client.get(f'{base}/missing')
+            raise AssertionError('404 was not raised')
+        except requests.exceptions.HTTPError:
+            pass
+        assert sum(1 for p, *_ in server.requests if p == '/missing') == 1
+        result['retry'] = dict(requests=len(server.requests))
+        client.close()
+        # 限速：同一主机相邻请求间隔不小于 1/rate
+        server.requests.clear()
+        client = Local(workers=workers, rate=rate, retries=0, backoff=0)
+        train = Train(client=client, cache=ResponseCache(path=None))
+        train.stop_overs_many(queries)
+        times = sorted(t for _, t, _ in server.requests)
+        gaps = [b-a for a, b in zip(times, times[1:])]
+        assert min(gaps) >= 0.8/rate, gaps
+        assert times[-1]-times[0] >= 0.9*(len(times)-1)/rate
+        result['rate'] = dict(requests=len(times), min_gap=min(gaps), seconds=times[-1]-times[0])
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return result
+
+
+def check_query_budget(from_station='利川', to_station='深圳北', train_number='D2'):
+    '''热点查询的单次语句数不超过预算
+
+    Return:
+        - dict, profiler.summary()
+    '''
+    profiler.reset()
+    get.train_numbers_by_stations(from_station, to_station)
+    get.train_numbers_by_stations_transfer(from_station, to_station)
+    get.journeys_by_train_number(train_number)
+    get.remaining_tickets_number(train_number, 1, date.today())
+    summary = profiler.summary()
+    for name, value in summary.items():
+        assert value['max_queries'] <= profiler.budget, f'{name}: {value}'
+    return summary
+
+
 if __name__ == '__main__':
     pass
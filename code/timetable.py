@@ -0,0 +1,528 @@
+__all__ = ('Stop', 'Leg', 'Itinerary', 'Timetable', 'timetable')
+
+
+import heapq
+import itertools
+
+from collections import defaultdict, namedtuple
+from warnings import warn
+
+try:
+    from .database import Journey, Station, session
+    from .config import min_connection_minutes, transfer_limit
+except:
+    from database import Journey, Station, session
+    from config import min_connection_minutes, transfer_limit
+
+
+Stop = namedtuple(
+    'Stop', (
+        'journey_id', 'station_id', 'station_index', 'distance',
+        'arrive_time', 'depart_time', 'arrive_day', 'depart_day',
+    )
+)
+Leg = namedtuple('Leg', ('train_number', 'from_station', 'to_station', 'depart', 'arrive'))
+Itinerary = namedtuple('Itinerary', ('legs', 'depart', 'arrive', 'duration'))
+
+DAY = 24 * 60
+sorts = ('depart', 'arrive', 'duration')  # 最早出发、最早到达、最快
+
+
+class Timetable:
+    '''时刻表内存索引
+
+    Note:
+        - 车站 -> 按 (train_number, station_index) 排序的倒排表
+        - 车次 -> 按 station_index 排序的停靠站数组
+        - 首次使用时从 journey/station 表加载，update 后下次使用时重建
+    '''
+    @property
+    def station_ids(self):
+        '''
+        Return:
+            - dict[str, int], 车站名 -> 车站 id
+        '''
+        return self._api('station_ids')
+
+    @property
+    def station_names(self):
+        '''
+        Return:
+            - dict[int, str], 车站 id -> 车站名
+        '''
+        return self._api('station_names')
+
+    @property
+    def stops(self):
+        '''
+        Return:
+            - dict[str, tuple[Stop]]
+        '''
+        return self._api('stops')
+
+    @property
+    def postings(self):
+        '''
+        Return:
+            - dict[int, list[tuple[str, int]]]
+        '''
+        return self._api('postings')
+
+    @property
+    def offsets(self):
+        '''
+        Return:
+            - dict[str, tuple[tuple[int, int]]], 相对始发的 (到达, 出发) 分钟数
+        '''
+        return self._api('offsets')
+
+    @property
+    def minutes(self):
+        '''
+        Return:
+            - dict[str, tuple[numpy.ndarray, numpy.ndarray]], 相对始发的到达、出发分钟数
+        Note:
+            - 所有车次拼接为两个数组，各车次是其中的视图，便于跨车次批量取值
+        '''
+        return self._api('minutes')
+
+    @property
+    def positions(self):
+        '''
+        Return:
+            - dict[str, dict[int, int]], station_index -> 停靠站数组下标
+        '''
+        return self._api('positions')
+
+    def trains(self, from_station, to_station=None):
+        '''列车直达（无换乘行为）
+
+        Argument:
+            - from_station: str
+            - to_station: str or None
+        Return:
+            - list[tuple[train_number, from_index, to_index]]
+        '''
+        if to_station is None:
+            to_station = from_station
+        from_station_id = self.station_ids.get(from_station)
+        to_station_id = self.station_ids.get(to_station)
+        if from_station_id is None or to_station_id is None:
+            args = f'from_station={from_station}, to_station={to_station}'
+            warn(f'Station does not exist: {args}')
+            return list()
+        empty = list()
+        a = self.postings.get(from_station_id, empty)
+        b = self.postings.get(to_station_id, empty)
+        return list(self._intersect(a, b))
+
+    def segment(self, train_number, from_station=None, to_station=None):
+        '''车站 -> 停靠站数组下标区间
+
+        Argument:
+            - train_number: str
+            - from_station, to_station: NoneType or str, 默认始发、终到
+        Return:
+            - tuple[int, int] or NoneType
+        '''
+        stops = self.stops.get(train_number)
+        if not stops:
+            return None
+        from_index, to_index = 0, len(stops) - 1
+        ids = [stop.station_id for stop in stops]
+        if from_station is not None:
+            station_id = self.station_ids.get(from_station)
+            if station_id not in ids:
+                return None
+            from_index = ids.index(station_id)
+        if to_station is not None:
+            station_id = self.station_ids.get(to_station)
+            if station_id not in ids[from_index+1:]:
+                return None
+            to_index = len(ids) - 1 - ids[::-1].index(station_id)
+        return from_index, to_index
+
+    def transfers(self, from_station, to_station, depart_time=None, min_connection=None, limit=None,
+            until_time=None, sort='arrive', after=None):
+        '''列车换乘（一次换乘）
+
+        Argument:
+            - from_station, to_station: str
+            - depart_time: NoneType or datetime.time, 最早出发时间
+            - min_connection: NoneType or int, 最短换乘分钟数
+            - limit: NoneType or int
+            - until_time: NoneType or datetime.time, 最晚出发时间
+            - sort: str, 见 sorts
+            - after: NoneType or tuple, 只返回排在该 sort_key 之后的行程（键集分页）
+        Return:
+            - list[Itinerary]
+        Note:
+            - 时间均为相对出发日 0 点的分钟数，列车按每日开行计算
+            - 同一对车次只保留最早到达的换乘站
+            - 按 sort 排序，相同时依次按两程车次排序；只保留前 limit 个（有界堆）
+        '''
+        limit = transfer_limit if limit is None else limit
+        candidates = self._transfers(from_station, to_station, depart_time, min_connection, until_time, sort, after)
+        return [self._itinerary(from_station, to_station, *value) for _, value in heapq.nsmallest(limit, candidates)]
+
+    def iter_transfers(self, from_station, to_station, depart_time=None, min_connection=None,
+            until_time=None, sort='arrive', after=None):
+        '''同 transfers，按 sort 顺序逐个生成全部行程
+
+        Note:
+            - 候选行程建堆后逐个弹出，只在取用时构造 Itinerary
+        '''
+        heap = list(self._transfers(from_station, to_station, depart_time, min_connection, until_time, sort, after))
+        heapq.heapify(heap)
+        while heap:
+            _, value = heapq.heappop(heap)
+            yield self._itinerary(from_station, to_station, *value)
+
+    @staticmethod
+    def sort_key(itinerary, sort):
+        '''
+        Argument:
+            - itinerary: Itinerary, transfers 或 iter_transfers 的结果
+            - sort: str, 见 sorts
+        Return:
+            - tuple[int, int, str, str], 用作下一页的 after
+        '''
+        first, second = (leg.train_number for leg in itinerary.legs)
+        return Timetable._sort_key(sort, itinerary.depart, itinerary.arrive, first, second)
+
+    def _itinerary(self, from_station, to_station, first, second, board, arrive, depart, end, station_id):
+        name = self.station_names[station_id]
+        return Itinerary(
+            (Leg(first, from_station, name, board, arrive), Leg(second, name, to_station, depart, end)),
+            board, end, end-board,
+        )
+
+    def _transfers(self, from_station, to_station, depart_time, min_connection, until_time, sort, after):
+        '''
+        Return:
+            - iteration[tuple[key, tuple[first, second, board, arrive, depart, end, station_id]]],
+              每对车次一个，key 见 _sort_key，只含 key 大于 after 的
+        Note:
+            - 换乘站只取能到达终点站的车次经过的车站（终点站倒排表），换乘车次也只在其中查找
+        '''
+        if sort not in sorts:
+            raise ValueError(f'sort must be one of {sorts}: {sort}')
+        from_station_id = self.station_ids.get(from_station)
+        to_station_id = self.station_ids.get(to_station)
+        if from_station_id is None or to_station_id is None:
+            args = f'from_station={from_station}, to_station={to_station}'
+            warn(f'Station does not exist: {args}')
+            return
+        start = self._minute(depart_time)
+        latest = self._latest(start, until_time)
+        min_connection = min_connection_minutes if min_connection is None else min_connection
+        empty = list()
+        # train_number -> 终点站最晚的下标
+        reach = dict()
+        for number, index in self.postings.get(to_station_id, empty):
+            reach[number] = self.positions[number][index]
+        # 换乘站 -> 之后到达终点站的 (车次, 换乘站下标, 终点站下标)
+        feeders = defaultdict(list)
+        for second, k in reach.items():
+            for j, stop in enumerate(self.stops[second][:k]):
+                if stop.station_id not in (from_station_id, to_station_id):
+                    feeders[stop.station_id].append((second, j, k))
+        # 倒排表按车次排序，环线同一车次的多个上车站相邻
+        postings = self.postings.get(from_station_id, empty)
+        for first, group in itertools.groupby(postings, key=lambda posting: posting[0]):
+            stops, offsets = self.stops[first], self.offsets[first]
+            best = dict()  # second -> (end, board, arrive, depart, station_id)
+            for _, index in group:
+                i = self.positions[first][index]
+                board = self._next(start, offsets[i][1])
+                for p in range(i+1, len(stops)):
+                    station_id = stops[p].station_id
+                    if station_id not in feeders:
+                        continue
+                    arrive = board + offsets[p][0] - offsets[i][1]
+                    for second, j, k in feeders[station_id]:
+                        if second == first:
+                            continue
+                        transfer = self.offsets[second]
+                        depart = self._next(arrive+min_connection, transfer[j][1])
+                        end = depart + transfer[k][0] - transfer[j][1]
+                        if second not in best or end < best[second][0]:
+                            best[second] = end, board, arrive, depart, station_id
+            for second, (end, board, arrive, depart, station_id) in best.items():
+                if latest is None or board <= latest:
+                    key = self._sort_key(sort, board, end, first, second)
+                    if after is None or key > after:
+                        yield key, (first, second, board, arrive, depart, end, station_id)
+
+    def direct(self, from_station, to_station=None, depart_time=None, until_time=None, sort='depart'):
+        '''直达车次的出发、到达时刻及历时（批量计算、过滤、排序）
+
+        Argument:
+            - from_station: str
+            - to_station: str or None
+            - depart_time, until_time: NoneType or datetime.time, 出发时刻窗口
+            - sort: str, 见 sorts
+        Return:
+            - list[Itinerary], 每个行程只有一程
+        '''
+        import numpy as np
+
+        trains = self.trains(from_station, to_station)
+        if not trains:
+            return list()
+        arrives, departs = self._api('arrives'), self._api('departs')
+        starts, positions = self._api('starts'), self.positions
+        i = np.array([starts[number]+positions[number][index] for number, index, _ in trains])
+        j = np.array([starts[number]+positions[number][index] for number, _, index in trains])
+        start = self._minute(depart_time)
+        depart = self._next(start, departs[i])
+        duration = arrives[j] - departs[i]
+        arrive = depart + duration
+        mask = self._window(depart, start, until_time)
+        names = from_station, from_station if to_station is None else to_station
+        result = list()
+        for k in self._rank(sort, depart, arrive, duration, mask):
+            leg = Leg(trains[k][0], *names, int(depart[k]), int(arrive[k]))
+            result.append(Itinerary((leg, ), leg.depart, leg.arrive, int(duration[k])))
+        return result
+
+    def earliest(self, from_station, to_station, depart_time=None, min_connection=None, transfers=2):
+        '''最早到达（RAPTOR，多次换乘）
+
+        Argument:
+            - from_station, to_station: str
+            - depart_time: NoneType or datetime.time
+            - min_connection: NoneType or int
+            - transfers: int, 最多换乘次数
+        Return:
+            - list[Itinerary], 每个换乘次数下到达时间更早的行程
+        '''
+        from_station_id = self.station_ids.get(from_station)
+        to_station_id = self.station_ids.get(to_station)
+        if from_station_id is None or to_station_id is None:
+            args = f'from_station={from_station}, to_station={to_station}'
+            warn(f'Station does not exist: {args}')
+            return list()
+        start = self._minute(depart_time)
+        min_connection = min_connection_minutes if min_connection is None else min_connection
+        empty, inf = list(), float('inf')
+        labels, parents = [{from_station_id: start}], [dict()]
+        best, marked, result = {from_station_id: start}, {from_station_id}, list()
+        for k in range(1, transfers+2):
+            previous = labels[-1]
+            label, parent = dict(previous), dict(parents[-1])
+            queue = dict()
+            for station_id in marked:
+                for number, index in self.postings.get(station_id, empty):
+                    p = self.positions[number][index]
+                    if p < queue.get(number, inf):
+                        queue[number] = p
+            marked = set()
+            for number, p in queue.items():
+                stops, offsets = self.stops[number], self.offsets[number]
+                board = None
+                for q in range(p, len(stops)):
+                    station_id = stops[q].station_id
+                    if board is not None:
+                        arrive = board + offsets[q][0] - offsets[i][1]
+                        if arrive < min(best.get(station_id, inf), best.get(to_station_id, inf)):
+                            label[station_id] = best[station_id] = arrive
+                            parent[station_id] = number, stops[i].station_id, board, arrive
+                            marked.add(station_id)
+                    if station_id in previous and station_id!=to_station_id:
+                        ready = previous[station_id] + (min_connection if k>1 else 0)
+                        depart = self._next(ready, offsets[q][1])
+                        if board is None or depart < board + offsets[q][1] - offsets[i][1]:
+                            board, i = depart, q
+            labels.append(label)
+            parents.append(parent)
+            if to_station_id in marked:
+                legs, station_id = list(), to_station_id
+                for r in range(k, 0, -1):
+                    number, board_station_id, board, arrive = parents[r][station_id]
+                    names = self.station_names[board_station_id], self.station_names[station_id]
+                    legs.append(Leg(number, *names, board, arrive))
+                    station_id = board_station_id
+                    if station_id == from_station_id:
+                        break
+                legs.reverse()
+                depart, arrive = legs[0].depart, legs[-1].arrive
+                result.append(Itinerary(tuple(legs), depart, arrive, arrive-depart))
+            if not marked:
+                break
+        return result
+
+    def update(self):
+        for key in tuple(self.__dict__.keys()):
+            if key.startswith('_'):
+                delattr(self, key)
+
+    def build(self, stations, journeys):
+        '''
+        Argument:
+            - stations: iteration[tuple[id, name]]
+            - journeys: iteration[tuple[train_number, *Stop]], 按 (train_number, station_index) 排序
+        '''
+        import numpy as np
+
+        station_ids = {name: id for id, name in stations}
+        station_names = {id: name for name, id in station_ids.items()}
+        stops = defaultdict(list)
+        postings = defaultdict(list)
+        for train_number, *stop in journeys:
+            stop = Stop(*stop)
+            if stop.station_id not in station_names:
+                continue
+            if stop.arrive_time is None and stop.depart_time is None:  # 无时刻，不能上下车
+                continue
+            stops[train_number].append(stop)
+            postings[stop.station_id].append((train_number, stop.station_index))
+        for value in postings.values():
+            value.sort()
+        self._station_ids = station_ids
+        self._station_names = station_names
+        self._stops = {key: tuple(val) for key, val in stops.items()}
+        self._postings = dict(postings)
+        self._offsets = {key: self._offset(val) for key, val in self._stops.items()}
+        self._positions = {
+            key: {stop.station_index: ith for ith, stop in enumerate(val)}
+            for key, val in self._stops.items()
+        }
+        lengths = [len(val) for val in self._offsets.values()]
+        total = sum(lengths)
+        self._arrives = np.fromiter(
+            (a for val in self._offsets.values() for a, _ in val), dtype=np.int64, count=total,
+        )
+        self._departs = np.fromiter(
+            (d for val in self._offsets.values() for _, d in val), dtype=np.int64, count=total,
+        )
+        self._starts, self._minutes, begin = dict(), dict(), 0
+        for key, length in zip(self._offsets, lengths):
+            self._starts[key] = begin
+            self._minutes[key] = self._arrives[begin:begin+length], self._departs[begin:begin+length]
+            begin += length
+
+    def _load(self):
+        stations = session.query(Station.id, Station.name).filter_by(is_valid=True)
+        columns = (
+            Journey.train_number, Journey.id, Journey.station_id, Journey.station_index,
+            Journey.distance, Journey.arrive_time, Journey.depart_time,
+            Journey.arrive_day, Journey.depart_day,
+        )
+        journeys = session.query(*columns).filter_by(is_valid=True) \
+            .order_by(Journey.train_number, Journey.station_index)
+        self.build(stations.all(), journeys.yield_per(10000))
+
+    def _api(self, name):
+        if not hasattr(self, f'_{name}'):
+            self._load()
+        return getattr(self, f'_{name}')
+
+    @staticmethod
+    def _minute(t):
+        return 0 if t is None else 60*t.hour + t.minute
+
+    @classmethod
+    def _window(cls, depart, start, until_time):
+        '''出发时刻（不早于 start）不晚于 until_time
+        '''
+        import numpy as np
+
+        latest = cls._latest(start, until_time)
+        if latest is None:
+            return np.ones(len(depart), dtype=bool)
+        return depart <= latest
+
+    @classmethod
+    def _latest(cls, start, until_time):
+        '''最晚出发时刻（分钟），until_time 早于 start 时按次日计
+        '''
+        if until_time is None:
+            return None
+        until = cls._minute(until_time)
+        if until < start % DAY:
+            until += DAY
+        return start - start%DAY + until
+
+    @staticmethod
+    def _sort_key(sort, depart, arrive, first, second):
+        '''换乘行程的全序：与 _rank 的主次关键字相同，再按两程车次
+        '''
+        if sort == 'depart':
+            return depart, arrive-depart, first, second
+        if sort == 'arrive':
+            return arrive, arrive-depart, first, second
+        return arrive-depart, arrive, first, second
+
+    @staticmethod
+    def _rank(sort, depart, arrive, duration, mask):
+        '''
+        Return:
+            - numpy.ndarray[int], mask 内按 sort 排序的下标
+        '''
+        import numpy as np
+
+        keys = {
+            'depart': (duration, depart), 'arrive': (duration, arrive), 'duration': (arrive, duration),
+        }
+        if sort not in keys:
+            raise ValueError(f'sort must be one of {sorts}: {sort}')
+        index = np.flatnonzero(mask)
+        return index[np.lexsort(tuple(key[index] for key in keys[sort]))]
+
+    @staticmethod
+    def _next(ready, depart):
+        '''不早于 ready 的下一班（每日开行）出发时刻
+        '''
+        return ready + (depart-ready) % DAY
+
+    @classmethod
+    def _offset(cls, stops):
+        '''按时刻单调递增推算跨天，不依赖 arrive_day/depart_day 的起算方式
+        '''
+        result, last = list(), None
+        for stop in stops:
+            pair = list()
+            for t in (stop.arrive_time, stop.depart_time):
+                if t is None:
+                    pair.append(None)
+                    continue
+                minute = cls._minute(t)
+                if last is not None:
+                    minute += last - last%DAY
+                    if minute < last:
+                        minute += DAY
+                pair.append(minute)
+                last = minute
+            arrive, depart = pair
+            result.append((
+                depart if arrive is None else arrive,
+                arrive if depart is None else depart,
+            ))
+        return tuple(result)
+
+    @staticmethod
+    def _intersect(a, b):
+        '''有序倒排表求交
+
+        Note:
+            - 环线列车同一车站可能出现多次，取最早上车、最晚下车
+        '''
+        i, j, m, n = 0, 0, len(a), len(b)
+        while i<m and j<n:
+            x, y = a[i][0], b[j][0]
+            if x < y:
+                i += 1
+            elif x > y:
+                j += 1
+            else:
+                from_index = a[i][1]
+                while i<m and a[i][0]==x:
+                    i += 1
+                while j<n and b[j][0]==x:
+                    j += 1
+                to_index = b[j-1][1]
+                if to_index > from_index:
+                    yield x, from_index, to_index
+
+timetable = Timetable()
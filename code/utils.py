@@ -1,86 +1,127 @@
-from collections import Counter
-from datetime import date, datetime
-from enum import Enum
+import itertools
+import time
+
+from datetime import date, datetime, timedelta
 from warnings import warn
 
+from sqlalchemy import text, update as _update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert as _insert
+from sqlalchemy.orm import aliased
+
 try:
     from .database import (
-        Admin, User, City, Order, Station, Journey, SeatType, Capacity, Ticket,
-        session,
+        Admin, User, City, Order, Station, Journey, StationPair, SeatType, Capacity, Ticket,
+        session, status, transaction,
     )
-    from .config import is_cached, residence_seconds
+    from .autocomplete import autocomplete
+    from .cache import QueryCache
+    from .config import (
+        is_cached, is_profiled, query_budget, query_cache_size, query_cache_ttl, residence_seconds,
+    )
+    from .fares import fare_matrix
+    from .identity import id_card_validator
+    from .inventory import inventory
+    from .profiler import QueryProfiler
+    from .timetable import timetable
 except:
     from database import (
-        Admin, User, City, Order, Station, Journey, SeatType, Capacity, Ticket,
-        session,
+        Admin, User, City, Order, Station, Journey, StationPair, SeatType, Capacity, Ticket,
+        session, status, transaction,
+    )
+    from autocomplete import autocomplete
+    from cache import QueryCache
+    from config import (
+        is_cached, is_profiled, query_budget, query_cache_size, query_cache_ttl, residence_seconds,
     )
-    from config import is_cached, residence_seconds
+    from fares import fare_matrix
+    from identity import id_card_validator
+    from inventory import inventory
+    from profiler import QueryProfiler
+    from timetable import timetable
 
 
-status = Enum('status', ('booked', 'paid', 'canceled'))
+query_cache = QueryCache(query_cache_size, query_cache_ttl, is_cached)
+profiler = QueryProfiler(query_budget, is_profiled)
+profiler.attach()
 
 
 class Cache:
-    '''数据缓存
+    '''数据缓存（由 query_cache 记忆化 get 的读方法）
     '''
-    def __init__(self, is_cached):
-        self.is_cached = is_cached
-
     @property
     def stations(self):
-        return self._api('station', get.stations)
+        return get.stations()
 
     @property
     def cities(self):
-        return self._api('cities', get.cities)
+        return get.cities()
 
     @property
     def provinces(self):
-        return self._api('provinces', get.provinces)
+        return get.provinces()
 
     @property
     def train_numbers(self):
-        return self._api('train_numbers', get.train_numbers)
+        return get.train_numbers()
 
     def has_train_number(self, train_number):
-        if self.is_cached:
-            return train_number in self.train_numbers
+        if query_cache.enabled:
+            return train_number in get.train_number_set()
         return get._by(Journey, train_number=train_number, is_valid=True) is not None
 
-    def update(self):
-        for key in tuple(self.__dict__.keys()):
-            if key.startswith('_'):
-                delattr(self, key)
+    def stats(self):
+        return query_cache.stats()
+
+    def warm(self):
+        '''预先加载内存时刻表及票价矩阵（应用启动时调用），首次查询、下单时不再加载
+        '''
+        if is_cached:
+            timetable.stops
+            fare_matrix.prices
 
-    def _api(self, name, function, *args, **kwargs):
-        if self.is_cached:
-            attr = getattr(self, f'_{name}', None)
-            if not attr:
-                attr = function(*args, **kwargs)
-                setattr(self, f'_{name}', attr)
-            return attr
-        return function(*args, **kwargs)
+    def update(self):
+        query_cache.clear()
 
-cache = Cache(is_cached)
+cache = Cache()
 
 
+@profiler.instrument
 class update:
     '''更新数据
     '''
     @classmethod
     def cache(cls):
         cache.update()
+        timetable.update()
+        inventory.update()
+        fare_matrix.update()
+        autocomplete.update()
 
     @classmethod
     def orders(cls):
-        '''加锁（read）
-        '''
-        now = datetime.now()
-        for order in get._by(Order, status=status.booked.value, iter=True, lock='read'):
-            if (now - order.create_date).seconds > residence_seconds:
-                order.status = status.canceled.value
+        '''取消超时未支付的订单（单条 UPDATE，使用 (status, create_date) 索引）
+        Return:
+            - int, 取消的订单数
+        '''
+        deadline = datetime.now() - timedelta(seconds=residence_seconds)
+        table = Order.__table__
+        statement = _update(table) \
+            .where(table.c.status==status.booked.value) \
+            .where(table.c.create_date<deadline) \
+            .values(status=status.canceled.value) \
+            .returning(
+                table.c.train_number, table.c.depart_date, table.c.carriage_index,
+                table.c.seat_num, table.c.depart_journey, table.c.arrive_journey,
+            )
+        with transaction():
+            orders = session.execute(statement).fetchall()
+        for order in orders:
+            inventory.release(order)
+        return len(orders)
 
     @classmethod
+    @query_cache.invalidates('capacity')
     def train(cls, train_number, carriage_index, seat_type=None, seat_num=None):
         '''
         Argument:
@@ -89,15 +130,18 @@ class update:
             - seat_type: int, in [1, 18]
             - seat_num: int
         '''
-        carriage = get._by(Capacity, train_number=train_number, carriage_index=carriage_index, is_valid=True)
-        if seat_type is not None:
-            assert get._by(SeatType, id=seat_type) is not None
-            carriage.seat_type = seat_type
-        if seat_num is not None:
-            carriage.seat_num = seat_num
-        cls._commit()
+        with transaction():
+            carriage = get._by(Capacity, train_number=train_number, carriage_index=carriage_index, is_valid=True)
+            if seat_type is not None:
+                assert get._by(SeatType, id=seat_type) is not None
+                carriage.seat_type = seat_type
+            if seat_num is not None:
+                carriage.seat_num = seat_num
+        inventory.update()
+        fare_matrix.update()
 
     @classmethod
+    @query_cache.invalidates('station')
     def station(cls, name, city_name_or_id=None, is_valid=None):
         '''
         Argument:
@@ -105,14 +149,53 @@ class update:
             - city_name_or_id: NoneType or str or int
             - is_valid: NoneType or bool
         '''
-        station = get._by(Station, name=name)
-        if city_name_or_id is not None:
-            if isinstance(city_name_or_id, str):
-                city_name_or_id, = get._by(City.id, name=city_name_or_id)
-            station.city_id = city_name_or_id
-        if is_valid is not None:
-            station.is_valid = is_valid
-        cls._commit()
+        with transaction():
+            station = get._by(Station, name=name)
+            if city_name_or_id is not None:
+                if isinstance(city_name_or_id, str):
+                    city_name_or_id, = get._by(City.id, name=city_name_or_id)
+                station.city_id = city_name_or_id
+            if is_valid is not None:
+                station.is_valid = is_valid
+        autocomplete.update()
+
+    @classmethod
+    def station_pairs(cls, train_numbers=None):
+        '''按车次重建 station_pair
+        Argument:
+            - train_numbers: NoneType or iteration[str], 默认全部车次
+        Return:
+            - int, 写入的行数
+        '''
+        with transaction():
+            return cls._station_pairs(train_numbers)
+
+    @classmethod
+    def _station_pairs(cls, train_numbers):
+        '''在当前事务中执行
+        '''
+        if train_numbers is None:
+            session.execute(text('truncate station_pair'))
+            condition, params = '', {}
+        else:
+            params = {'train_numbers': list(train_numbers)}
+            session.execute(text(
+                'delete from station_pair where train_number = any(:train_numbers)'
+            ), params)
+            condition = 'and a.train_number = any(:train_numbers)'
+        return session.execute(text(cls._station_pairs_sql.format(condition=condition)), params).rowcount
+
+    # 环线列车同一车站可能出现多次，取最早上车、最晚下车；没有任何时刻的停靠站不能上下车（与时刻表索引一致）
+    _station_pairs_sql = '''
+        insert into station_pair (from_station_id, to_station_id, train_number, from_index, to_index)
+        select a.station_id, b.station_id, a.train_number, min(a.station_index), max(b.station_index)
+        from journey as a join journey as b
+            on b.train_number = a.train_number and b.station_index > a.station_index
+        where a.is_valid and b.is_valid {condition}
+            and (a.arrive_time is not null or a.depart_time is not null)
+            and (b.arrive_time is not null or b.depart_time is not null)
+        group by a.station_id, b.station_id, a.train_number
+    '''
 
     @classmethod
     def admin_password(cls, name, password):
@@ -126,15 +209,12 @@ class update:
     def ticket_print(cls, ticket_id):
         '''出票更新 Ticket.is_print
         '''
-        ticket = get._by(Ticket, id=ticket_id, lock='read')
-        ticket.is_print = True
-        cls._commit()
-
-    @classmethod
-    def _commit(cls):
-        session.commit()
+        with transaction():
+            ticket = get._by(Ticket, id=ticket_id, lock='read')
+            ticket.is_print = True
 
 
+@profiler.instrument
 class check:
     '''检查合法性等
     '''
@@ -144,20 +224,33 @@ class check:
 
     @classmethod
     def id_card(cls, id_card):
+        '''与数据库函数 is_id_valid 结果一致，不访问数据库
+        '''
         assert id_card.replace('X', '').isdigit() and len(id_card)==18
-        return session.execute(f"select is_id_valid('{id_card}');").first()[0]
+        return id_card_validator.is_valid(id_card)
+
+    @classmethod
+    def id_cards(cls, id_cards):
+        '''批量校验
+        Return:
+            - numpy.ndarray[bool]
+        '''
+        return id_card_validator.validate_many(id_cards)
 
     @classmethod
     def admin_password(cls, name, password):
-        admin = get.admin(name)
-        return admin.check_password(password)
+        with transaction():
+            admin = get.admin(name)
+            return admin.check_password(password)
 
     @classmethod
     def user_password(cls, id_card, password):
-        user = get.user(id_card)
-        return user.check_password(password)
+        with transaction():
+            user = get.user(id_card)
+            return user.check_password(password)
 
 
+@profiler.instrument
 class get:
     '''数据库数据获取
     '''
@@ -184,6 +277,7 @@ class get:
         return cls._by(User, id_card_number=id_card, lock=lock)
 
     @classmethod
+    @query_cache.memoize('city')
     def cities(cls):
         '''
         Return:
@@ -192,6 +286,7 @@ class get:
         return cls._compress(session.query(City.name))
 
     @classmethod
+    @query_cache.memoize('city')
     def provinces(cls):
         '''
         Return:
@@ -200,6 +295,7 @@ class get:
         return cls._compress(session.query(City.province.distinct()))
 
     @classmethod
+    @query_cache.memoize('station')
     def stations(cls):
         '''
         Return:
@@ -208,6 +304,7 @@ class get:
         return cls._compress(cls._by(Station.name, is_valid=True, all=True))
 
     @classmethod
+    @query_cache.memoize('journey')
     def train_numbers(cls):
         '''
         Return:
@@ -218,6 +315,7 @@ class get:
         return cls._compress(cls._by(Journey.train_number.distinct(), is_valid=True, all=True))
 
     @classmethod
+    @query_cache.memoize('city')
     def cities_by_province(cls, province):
         '''
         Argument:
@@ -228,6 +326,7 @@ class get:
         return cls._compress(cls._by(City.name, province=province, all=True))
 
     @classmethod
+    @query_cache.memoize('city', 'station')
     def stations_by_city(cls, city_name):
         '''
         Argument:
@@ -265,6 +364,7 @@ class get:
         return get._by(Ticket, user_id=1, all=True)
 
     @classmethod
+    @query_cache.memoize('station', 'journey')
     def train_numbers_by_stations(cls, from_station, to_station=None):
         '''列车直达（无换乘行为）
         Argument:
@@ -274,78 +374,176 @@ class get:
             - list[str]
         Note:
             - 环线：厦门、南昌、福州南、三亚、包头东、海口东
+            - 查询 station_pair（主键查找），结果由 query_cache 记忆化；
+              附时刻的直达及换乘查询见 itineraries_by_stations 等（内存时刻表）
+        '''
+        # 环线的起终点相同
+        depart, arrive = aliased(Station), aliased(Station)
+        query = session.query(StationPair.train_number) \
+            .join(depart, depart.id==StationPair.from_station_id) \
+            .join(arrive, arrive.id==StationPair.to_station_id) \
+            .filter(
+                depart.name==from_station, depart.is_valid,
+                arrive.name==(from_station if to_station is None else to_station), arrive.is_valid,
+            ) \
+            .order_by(StationPair.train_number)
+        return cls._compress(query)
+
+    @classmethod
+    def itineraries_by_stations(cls, from_station, to_station=None, depart_time=None,
+            until_time=None, sort='depart'):
+        '''列车直达，附出发、到达时刻及历时
+        Argument:
+            - from_station: str
+            - to_station: str or None
+            - depart_time, until_time: NoneType or datetime.time, 出发时刻窗口
+            - sort: str, 'depart'（最早出发）、'arrive'（最早到达）或 'duration'（最快）
+        Return:
+            - list[Itinerary], 时间为相对出发日 0 点的分钟数
         '''
-        # same stations
-        if to_station is None or from_station==to_station:
-            station_id = cls._by(Station.id, name=from_station, is_valid=True)
-            numbers = cls._by(Journey.train_number, station_id=station_id, is_valid=True, all=True)
-            counter = Counter(cls._compress(numbers))
-            return [k for k, v in counter.items() if v > 1]
-        # different stations
-        from_station_id = cls._by(Station.id, name=from_station, is_valid=True)
-        to_station_id = cls._by(Station.id, name=to_station, is_valid=True)
-        if not (from_station_id is None or to_station_id):
-            args = f'from_station_id={from_station_id}, to_station_id={to_station_id}'
-            warn(f'Station does not exist: {args}')
-            return list()
-        columns = Journey.train_number, Journey.station_index
-        from_train_numbers = cls._by(*columns, station_id=from_station_id, is_valid=True, all=True)
-        to_train_numbers = cls._by(*columns, station_id=to_station_id, all=True)
-        # find the train_number where from_station and to_station in it
-        data = dict(from_train_numbers)
-        return [i for i, j in to_train_numbers if (i in data and j>data[i])]
-
-    @classmethod
-    def train_numbers_by_stations_transfer(cls, from_station, to_station):
+        return timetable.direct(from_station, to_station, depart_time, until_time, sort)
+
+    @classmethod
+    def train_numbers_by_stations_transfer(cls, from_station, to_station, depart_time=None,
+            min_connection=None, limit=None, until_time=None, sort='arrive', after=None, iter=False):
         '''列车连接（有换乘行为）
         Argument:
             - from_station: str
             - to_station: str
+            - depart_time: NoneType or datetime.time, 最早出发时间
+            - min_connection: NoneType or int, 最短换乘分钟数，默认见 config
+            - limit: NoneType or int, 返回行程数，默认见 config；iter 为 True 时默认不限
+            - until_time: NoneType or datetime.time, 最晚出发时间
+            - sort: str, 'depart'、'arrive' 或 'duration'
+            - after: NoneType or tuple, 上一页最后一个行程的 timetable.sort_key
+            - iter: bool, 按顺序逐个生成
         Return:
-            - iteration[list[train_number, Station, train_number]]
-        '''
-        from_station_id = cls._by(Station.id, name=from_station, is_valid=True)
-        columns = Journey.train_number, Journey.station_index
-        from_train_numbers = cls._by(*columns, station_id=from_station_id, is_valid=True, all=True)
-        to_station_id = cls._by(Station.id, name=to_station, is_valid=True)
-        to_train_numbers = cls._by(*columns, station_id=to_station_id, all=True)
-        inter_columns = Journey.station_id, Journey.station_index
-        # [train_number, Station, train_number]
-        for number, index in from_train_numbers:
-            ids = (
-                i for i, j in cls._by(*inter_columns, train_number=number, is_valid=True, all=True)
-                if j > index
+            - list[Itinerary] or iteration[Itinerary], 按 sort 排序，时间为相对出发日 0 点的分钟数
+        '''
+        if iter:
+            itineraries = timetable.iter_transfers(
+                from_station, to_station, depart_time, min_connection, until_time, sort, after,
             )
-            for id in ids:
-                from_second_train_numbers = cls._by(*columns, station_id=id, all=True)
-                data = dict(from_second_train_numbers)
-                yield from (
-                    [number, get._by(Station, id=id, is_valid=True), i]
-                    for i, j in to_train_numbers if (i in data and j > data[i])
-                )
+            return itineraries if limit is None else itertools.islice(itineraries, limit)
+        return timetable.transfers(
+            from_station, to_station, depart_time, min_connection, limit, until_time, sort, after,
+        )
+
+    @classmethod
+    def earliest_itineraries(cls, from_station, to_station, depart_time=None,
+            min_connection=None, transfers=2):
+        '''最早到达（可多次换乘）
+        Argument:
+            - from_station: str
+            - to_station: str
+            - depart_time: NoneType or datetime.time, 最早出发时间
+            - min_connection: NoneType or int, 最短换乘分钟数，默认见 config
+            - transfers: int, 最多换乘次数
+        Return:
+            - list[Itinerary], 换乘次数递增、到达时间递减，每个换乘次数至多一个
+        '''
+        return timetable.earliest(from_station, to_station, depart_time, min_connection, transfers)
+
+    @classmethod
+    def fares(cls, segments):
+        '''批量票价（一次向量化计算，不查询数据库）
+        Argument:
+            - segments: iteration[tuple[train_number, from_station, to_station]]
+        Return:
+            - list[dict[str, float] or NoneType], 座位类型名 -> 票价，区间不存在时为 None
+        '''
+        positions = ((s[0], timetable.segment(*s)) for s in segments)
+        return fare_matrix.quote_many(None if p is None else (n, *p) for n, p in positions)
+
+    @classmethod
+    def station_completions(cls, prefix, limit=None):
+        '''站名前缀补全（站名、拼音、拼音码、首字母），按热门程度排序
+        Argument:
+            - prefix: str
+            - limit: NoneType or int
+        Return:
+            - list[str]
+        '''
+        if limit is None:
+            return autocomplete.complete(prefix)
+        return autocomplete.complete(prefix, limit)
+
+    @classmethod
+    @query_cache.memoize('journey')
+    def train_number_set(cls):
+        '''
+        Return:
+            - frozenset[str]
+        '''
+        return frozenset(cls.train_numbers())
 
     @classmethod
     def journeys_by_train_number(cls, train_number, lock=None):
         '''
         Argument:
             - train_number: str
+            - lock: NoneType or str, 加锁时不使用缓存
         Return:
             - list[Journey]
         '''
+        if lock is None and query_cache.enabled:
+            return list(cls._journeys_by_train_number(train_number))
         return cls._by(Journey, train_number=train_number, is_valid=True, all=True, lock=lock)
 
     @classmethod
-    def remaining_tickets_number(cls, train_number, carriage_index, depart_date):
+    @query_cache.memoize('journey')
+    def _journeys_by_train_number(cls, train_number):
+        '''缓存的 Journey 与会话分离，只读
+        '''
+        journeys = cls._by(Journey, train_number=train_number, is_valid=True, all=True)
+        for journey in journeys:
+            session.expunge(journey)
+        return tuple(journeys)
+
+    @classmethod
+    def remaining_tickets_number(cls, train_number, carriage_index, depart_date,
+            depart_station=None, arrive_station=None):
         '''
         Argument:
             - train_number: str
             - carriage_index: int
             - depart_date: datetime.date
+            - depart_station, arrive_station: NoneType or str, 默认全程
+        Note:
+            - 开启缓存时使用座位占用位图，可按区间查询
         '''
+        if is_cached:
+            segment = timetable.segment(train_number, depart_station, arrive_station)
+            if segment is None:
+                return None
+            return inventory.remaining(train_number, depart_date, carriage_index, *segment)
         total = cls._by(Capacity.seat_num, train_number=train_number, carriage_index=carriage_index, is_valid=True)
-        used = cls._by(Ticket, depart_date=depart_date, count=True)
+        used = cls._by(Ticket, train_number=train_number, carriage_index=carriage_index,
+            depart_date=depart_date, count=True)
         return total[0] - used
 
+    @classmethod
+    def occupied_seats(cls, train_number, carriage_index, depart_date, from_index, to_index):
+        '''区间 [from_index, to_index) 内已被未取消订单占用的座位
+        Argument:
+            - train_number: str
+            - carriage_index: int
+            - depart_date: datetime.date
+            - from_index, to_index: int, station_index
+        Return:
+            - set[int]
+        '''
+        depart, arrive = aliased(Journey), aliased(Journey)
+        query = session.query(Order.seat_num) \
+            .join(depart, depart.id==Order.depart_journey) \
+            .join(arrive, arrive.id==Order.arrive_journey) \
+            .filter(
+                Order.train_number==train_number, Order.carriage_index==carriage_index,
+                Order.depart_date==depart_date, Order.status!=status.canceled.value,
+                depart.station_index<to_index, arrive.station_index>from_index,
+            )
+        return set(cls._compress(query))
+
     @classmethod
     def _compress(cls, data):
         return [d[0] for d in data]
@@ -363,56 +561,58 @@ class get:
             if iter:
                 return query
             return query.first()
-        except:
+        except SQLAlchemyError:
             args = f'models={repr(models)}, all={all}, condition={condition}'
             warn(f'Query fails: {args}')
             session.rollback()
             return list() if all else None
 
 
+@profiler.instrument
 class registered:
     '''注册或对已有用户修改密码（二次注册）
     '''
     @classmethod
     def admin(cls, name, password, chpasswd=False):
-        admin = get.admin(name, lock='update')
-        assert chpasswd is (admin is not None)
-        if chpasswd:
-            admin.set_password(password)
-        else:
-            admin = Admin(name=name, password=password)
-            session.add(admin)
-        session.commit()
-        return admin
+        with transaction():
+            admin = get.admin(name, lock='update')
+            assert chpasswd is (admin is not None)
+            if chpasswd:
+                admin.set_password(password)
+            else:
+                admin = Admin(name=name, password=password)
+                session.add(admin)
+            return admin
 
     @classmethod
     def user(cls, name, phone, id_card, password, chpasswd=False):
-        if not chpasswd:
-            assert check.phone(phone) and check.id_card(id_card)
-        user = get.user(id_card, lock='read')
-        assert chpasswd is (user is not None)
-        if chpasswd:
-            user.set_password(password)
-        else:
-            user = User(
-                name=name, phone_number=phone, id_card=id_card, password=password
-            )
-            session.add(user)
-        session.commit()
-        return user
+        with transaction():
+            if not chpasswd:
+                assert check.phone(phone) and check.id_card(id_card)
+            user = get.user(id_card, lock='read')
+            assert chpasswd is (user is not None)
+            if chpasswd:
+                user.set_password(password)
+            else:
+                user = User(
+                    name=name, phone_number=phone, id_card=id_card, password=password
+                )
+                session.add(user)
+            return user
 
 
+@profiler.instrument
 class add:
     '''处理订单，添加数据到数据库
     '''
     @classmethod
     def order(cls, user_id, train_number, carriage_index, seat_num, depart_date, depart_station, arrive_station):
-        '''
+        '''加锁（advisory，按车次、日期、车厢）
         Argument:
             - user_id: int
             - train_number: str
             - carriage_index: int
-            - seat_num: int
+            - seat_num: NoneType or int, None 表示自动分配区间内空闲座位
             - depart_date: datetime.date
             - depart_station: str
             - arrive_station: str
@@ -421,10 +621,7 @@ class add:
         assert get._by(User, id=user_id) is not None
         # assert cache.has_train_number(train_number)  # cache train_numbers
         capacity = get._by(Capacity, train_number=train_number, carriage_index=carriage_index, is_valid=True)
-        assert capacity is not None and 1<=seat_num<=capacity.seat_num  # int
-        for order in get._by(Order, train_number=train_number, carriage_index=carriage_index,
-                seat_num=seat_num, depart_date=depart_date, iter=True):
-            assert order.status == status.canceled.value
+        assert capacity is not None and (seat_num is None or 1<=seat_num<=capacity.seat_num)  # int
         assert depart_date >= date.today()
         depart_station_id = get._by(Station.id, name=depart_station, is_valid=True)
         arrive_station_id = get._by(Station.id, name=arrive_station, is_valid=True)
@@ -432,8 +629,23 @@ class add:
         arrive_station = get._by(Journey, train_number=train_number, station_id=arrive_station_id, is_valid=True)
         distance = arrive_station.distance - depart_station.distance
         assert distance > 0
+        basic_price = fare_matrix.basic_price(capacity.seat_type) if is_cached else None
+        if basic_price is None:  # 票价矩阵加载后新增的座位类型
+            basic_price, = get._by(SeatType.basic_price, id=capacity.seat_type)
+        # choose the seat while holding the lock, released by commit or rollback
+        try:
+            cls._lock(train_number, depart_date, carriage_index)
+            occupied = get.occupied_seats(
+                train_number, carriage_index, depart_date,
+                depart_station.station_index, arrive_station.station_index,
+            )
+            if seat_num is None:
+                seat_num = next((i for i in range(1, capacity.seat_num+1) if i not in occupied), None)
+            assert seat_num is not None and seat_num not in occupied
+        except:
+            session.rollback()
+            raise
         # add order
-        basic_price, = get._by(SeatType.basic_price, id=capacity.seat_type)
         kwargs = {
             'status': status.booked.value, 'create_date': datetime.now(), 'user_id': user_id,
             'train_number': train_number, 'carriage_index': carriage_index, 'seat_num': seat_num,
@@ -442,6 +654,7 @@ class add:
         }
         order = Order(**kwargs)
         assert cls._all(order)
+        inventory.book(order)
         return order
 
     @classmethod
@@ -463,6 +676,7 @@ class add:
             depart_journey=order.depart_journey, arrive_journey=order.arrive_journey,
         )
         assert cls._all(ticket)
+        inventory.book(ticket)
         return ticket
 
     @classmethod
@@ -473,15 +687,80 @@ class add:
             - seat_types: tuple[int]
             - seat_nums: tuple[int]
         '''
-        for ith, (key, val) in enumerate(zip(seat_types, seat_nums)):
-            assert get._by(SeatType, id=key) is not None
-            carriage = Capacity(
-                train_number=train_number, carriage_index=ith+1,
-                seat_type=key, seat_num=val
-            )
-            cls._all(carriage)
+        return cls.trains({train_number: (tuple(zip(seat_types, seat_nums)), None)}, replace=False)
 
     @classmethod
+    @query_cache.invalidates('capacity', 'journey')
+    def trains(cls, trains, replace=True):
+        '''批量添加或替换车次（单个事务，多行 INSERT）
+        Argument:
+            - trains: dict[train_number, tuple[carriages, journeys]]
+                - carriages: iteration[tuple[seat_type, seat_num]]，按车厢顺序
+                - journeys: NoneType or iteration[tuple[
+                    station_name, arrive_time, depart_time, arrive_day, depart_day, distance
+                  ]]，按停靠顺序，None 表示不修改时刻表
+            - replace: bool, 是否先使已有的车厢及停靠站失效
+        Return:
+            - int, 车次数
+        '''
+        seat_types = set(get._compress(session.query(SeatType.id)))
+        station_ids = dict(session.query(Station.name, Station.id).filter_by(is_valid=True))
+        capacities, journeys = list(), list()
+        for train_number, (carriages, stops) in trains.items():
+            for ith, (seat_type, seat_num) in enumerate(carriages):
+                assert seat_type in seat_types, f'Seat type does not exist: {seat_type}'
+                capacities.append(dict(
+                    train_number=train_number, carriage_index=ith+1,
+                    seat_type=seat_type, seat_num=seat_num, is_valid=True,
+                ))
+            for ith, (name, *times, distance) in enumerate(stops or ()):
+                assert name in station_ids, f'Station does not exist: {name}'
+                journeys.append(dict(
+                    train_number=train_number, station_index=ith+1, station_id=station_ids[name],
+                    distance=distance, is_valid=True,
+                    **dict(zip(('arrive_time', 'depart_time', 'arrive_day', 'depart_day'), times)),
+                ))
+        replaced = [k for k, (_, stops) in trains.items() if stops is not None]
+        with transaction():
+            if replace:
+                session.query(Capacity).filter(Capacity.train_number.in_(tuple(trains))) \
+                    .update({Capacity.is_valid: False}, synchronize_session=False)
+                # 负的 id 保证 (train_number, station_index) 唯一
+                session.query(Journey).filter(Journey.train_number.in_(replaced), Journey.is_valid) \
+                    .update({
+                        Journey.station_index: -Journey.id, Journey.is_valid: False,
+                        Journey.arrive_time: None, Journey.depart_time: None,
+                        Journey.arrive_day: None, Journey.depart_day: None,
+                    }, synchronize_session=False)
+            table = Capacity.__table__
+            for chunk in cls._chunks(capacities):
+                statement = _insert(table).values(chunk)
+                if replace:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=(table.c.train_number, table.c.carriage_index),
+                        set_=dict(
+                            seat_type=statement.excluded.seat_type,
+                            seat_num=statement.excluded.seat_num, is_valid=True,
+                        ),
+                    )
+                session.execute(statement)
+            if journeys:
+                # psql 导入等显式写入 id 后序列可能落后于 max(id)；只向前推进，不影响并发分配的 id
+                session.execute(text('''
+                    select setval(pg_get_serial_sequence('journey', 'id'), greatest(
+                        coalesce(max(id), 0)+1, nextval(pg_get_serial_sequence('journey', 'id'))
+                    ), false) from journey
+                '''))
+            for chunk in cls._chunks(journeys):
+                session.execute(_insert(Journey.__table__).values(chunk))
+            update._station_pairs(trains.keys())
+        timetable.update()
+        inventory.update()
+        fare_matrix.update()
+        return len(trains)
+
+    @classmethod
+    @query_cache.invalidates('station')
     def station(cls, name, city_name_or_id):
         '''
         Argument:
@@ -494,6 +773,7 @@ class add:
         id = get._by(Station, count=True)
         station = Station(id=id+1, name=name, city_id=city_name_or_id)
         cls._all(station)
+        autocomplete.update()
 
     @classmethod
     def admin(cls, name, password):
@@ -506,15 +786,26 @@ class add:
     @classmethod
     def _all(cls, *instances):
         try:
-            session.add_all(instances)
-            session.commit()
+            with transaction():
+                session.add_all(instances)
             return True
         except Exception as e:
             print(e)
             warn(f'Add fails: instances={instances}')
-            session.rollback()
             return False
 
+    @classmethod
+    def _chunks(cls, rows, size=1000):
+        for ith in range(0, len(rows), size):
+            yield rows[ith:ith+size]
+
+    @classmethod
+    def _lock(cls, train_number, depart_date, carriage_index):
+        '''事务级 advisory lock，同一车厢的订票串行，不同车厢互不影响
+        '''
+        key = f'{train_number}|{depart_date}|{carriage_index}'
+        session.execute(text('select pg_advisory_xact_lock(hashtext(:key))'), {'key': key})
+
     @classmethod
     def _sec_diff(cls, begin_time, end_time, day=0):
         '''
@@ -528,75 +819,127 @@ class add:
         return f(end_time) - f(begin_time) + 86400*day
 
 
+@profiler.instrument
 class delete:
     '''删除数据库数据
     '''
     @classmethod
-    def station(cls, name=None, id=None):
-        '''
+    @query_cache.invalidates('station', 'journey')
+    def station(cls, name=None, id=None, dry_run=False):
+        '''停用车站并重排经停车次的 station_index（集合式 UPDATE，单个事务）
         Argument:
             - name: NoneType or str
             - id: NoneType or int
+            - dry_run: bool, 执行后回滚，只报告影响范围及耗时
+        Return:
+            - dict, trains: 车次数, journeys: 变更的停靠站数, seconds: 耗时
         '''
-        if name is not None:
-            station = get._by(Station, name=name, is_valid=True)
-            station.is_valid = False
-            id = station.id
-        else:  # id is not None
-            station = get._by(Station, id=id, is_valid=True)
+        begin = time.perf_counter()
+        try:
+            if name is not None:
+                station = get._by(Station, name=name, is_valid=True)
+            else:  # id is not None
+                station = get._by(Station, id=id, is_valid=True)
+            assert station is not None
             station.is_valid = False
-        train_numbers = get._by(Journey.train_number.distinct(), station_id=id, is_valid=True, all=True)
-        for train_number, in train_numbers:
-            journeys = get.journeys_by_train_number(train_number, lock='read')
-            for journey in journeys:
-                if journey.station_id == id:
-                    index = journey.station_index
-                    left, right = journey.arrive_time is None, journey.depart_time is None
-                    journey.station_index = - len(journeys)
-                    journey.arrive_time = journey.depart_time = None
-                    journey.arrive_day = journey.depart_day = None
-                    journey.is_valid = False
-                    break
-            for journey in journeys:
-                if journey.station_index > index:
-                    journey.station_index -= 1
-                if left and journey.station_index==index+1:
-                    journey.arrive_day = journey.arrive_time = None
-                if right and journey.station_index==index-1:
-                    journey.depart_day = journey.depart_time = None
-        cls._commit()
+            params = {'id': station.id, 'offset': 1 << 30}
+            trains, journeys = session.execute(text(cls._station_sql[0]), params).first()
+            for sql in cls._station_sql[1:]:
+                session.execute(text(sql), params)
+            numbers = get._compress(session.execute(text('select distinct train_number from affected')))
+            update._station_pairs(numbers)
+            if dry_run:
+                session.rollback()
+            else:
+                session.commit()
+        except:
+            session.rollback()
+            raise
+        if not dry_run:
+            timetable.update()
+            inventory.update()
+            fare_matrix.update()
+            autocomplete.update()
+        return {'trains': trains, 'journeys': journeys, 'seconds': time.perf_counter()-begin}
+
+    # offset: 重排时先写到负数区间，避免 (train_number, station_index) 唯一约束的中间冲突
+    _station_sql = (
+        '''
+        create temporary table affected on commit drop as
+            select station_index, train_number, arrive_time is null as first,
+                depart_time is null as last
+            from journey where station_id = :id and is_valid;
+        select count(distinct j.train_number), count(*) from journey j
+        join (select distinct train_number from affected) a using (train_number)
+        where j.is_valid and (j.station_id = :id or exists (
+            select 1 from affected t where t.train_number = j.train_number and (
+                j.station_index > t.station_index or (t.last and j.station_index = t.station_index-1)
+            )
+        ))
+        ''',
+        '''
+        update journey j set arrive_time = null, arrive_day = null from affected t
+        where t.first and j.train_number = t.train_number
+            and j.station_index = t.station_index+1 and j.is_valid
+        ''',
+        '''
+        update journey j set depart_time = null, depart_day = null from affected t
+        where t.last and j.train_number = t.train_number
+            and j.station_index = t.station_index-1 and j.is_valid
+        ''',
+        '''
+        update journey j set station_index = -:offset - j.station_index + (
+            select count(*) from affected t
+            where t.train_number = j.train_number and t.station_index < j.station_index
+        )
+        where j.is_valid and j.station_id != :id
+            and j.train_number in (select train_number from affected)
+        ''',
+        '''
+        update journey set station_index = -id, is_valid = false,
+            arrive_time = null, depart_time = null, arrive_day = null, depart_day = null
+        where station_id = :id and is_valid
+        ''',
+        '''
+        update journey set station_index = -:offset - station_index
+        where is_valid and station_index <= -:offset
+            and train_number in (select train_number from affected)
+        ''',
+    )
 
     @classmethod
+    @query_cache.invalidates('capacity', 'journey')
     def train(cls, train_number):
         '''
         Argument:
             - train_number: str
         '''
-        for train in get._by(Capacity, train_number=train_number, is_valid=True, iter=True):
-            train.is_valid = False
-        for journey in get._by(Journey, train_number=train_number, is_valid=True, iter=True):
-            journey.station_index = - journey.station_index
-            journey.arrive_day = journey.arrive_time = None
-            journey.depart_day = journey.depart_time = None
-            journey.is_valid = False
-        cls._commit()
+        with transaction():
+            for train in get._by(Capacity, train_number=train_number, is_valid=True, iter=True):
+                train.is_valid = False
+            # 与 add.trains 一致用负的 id，重新添加后再次删除时不与已失效的行冲突
+            for journey in get._by(Journey, train_number=train_number, is_valid=True, iter=True):
+                journey.station_index = - journey.id
+                journey.arrive_day = journey.arrive_time = None
+                journey.depart_day = journey.depart_time = None
+                journey.is_valid = False
+            session.flush()
+            update._station_pairs((train_number, ))
+        timetable.update()
+        inventory.update()
+        fare_matrix.update()
 
     @classmethod
     def _all(cls, *instances):
         try:
-            for instance in instances:
-                session.delete(instance)
-            session.commit()
+            with transaction():
+                for instance in instances:
+                    session.delete(instance)
             return True
         except:
             warn(f'Delete fails: instances={instances}')
-            session.rollback()
             return False
 
-    @classmethod
-    def _commit(cls):
-        session.commit()
-
 
 if __name__ == '__main__':
     if get.admin('admin') is None:
@@ -634,9 +977,8 @@ if __name__ == '__main__':
     print(get.train_numbers_by_stations('利川', '深圳北'))
 
     print('成都东 到 深圳北')
-    i = get.train_numbers_by_stations_transfer('成都东', '深圳北' )
-    for _ in range(10):
-        print(next(i))
+    for itinerary in get.train_numbers_by_stations_transfer('成都东', '深圳北'):
+        print(itinerary)
 
     print('余票信息 D1 1 号车厢')
     number = get.remaining_tickets_number('D2', 1, date(2020, 5, 20))
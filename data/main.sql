@@ -1,7 +1,7 @@
 create table admin (
     id serial not null constraint admins_pkey primary key,
     name varchar(30) not null constraint name_key unique,
-    password varchar(100) not null
+    password varchar(255) not null
 );
 
 create table seat_type (
@@ -47,12 +47,23 @@ create table journey (
 );
 create index station_id_index on journey (station_id, station_index, id);
 
+-- 车站对 -> 直达车次（journey 的派生表），导入数据后由 data/station_pair.sql 填充
+create table station_pair (
+    from_station_id integer not null,
+    to_station_id integer not null,
+    train_number varchar(20) not null,
+    from_index integer not null,
+    to_index integer not null,
+    constraint station_pair_pkey primary key (from_station_id, to_station_id, train_number)
+);
+create index station_pair_train_number_index on station_pair (train_number);
+
 create table "user" (
     id serial not null constraint user_pk primary key,
     name varchar(30) not null,
     phone_number char(11) not null,
     id_card_number char(18) not null,
-    password varchar(100) not null
+    password varchar(255) not null
 );
 create unique index user_id_card_number_uindex on "user" (id_card_number);
 
@@ -69,6 +80,7 @@ create table "order" (
     depart_date date not null,
     train_number varchar(20) not null
 );
+create index order_status_create_date_index on "order" (status, create_date);
 
 create table ticket (
     id serial not null constraint tickets_pkey primary key,
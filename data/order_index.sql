@@ -0,0 +1,4 @@
+-- 取消超时订单（update.orders）使用的 (status, create_date) 索引
+-- main.sql 已包含；在此之前创建的数据库执行一次，可重复执行
+create index if not exists order_status_create_date_index on "order" (status, create_date);
+analyze "order";
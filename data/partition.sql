@@ -0,0 +1,111 @@
+-- 把 order、ticket 改为按 depart_date 按月范围分区，在 main.sql 及数据导入之后执行一次
+-- 分区命名为 order_yyyy_mm、ticket_yyyy_mm，范围之外的行落在 order_default、ticket_default
+-- 之后由 python -m code.archive 预建分区并归档过期分区
+-- 需要 PostgreSQL 12 及以上（ticket 的外键引用分区表）；order_trigger 建在每个分区上，
+-- 不依赖 PostgreSQL 13 才支持的分区表行级触发器
+begin;
+
+-- 创建 [first, last] 覆盖的月分区（已存在则跳过），default 分区中对应月份的行移入新分区
+create or replace function create_partitions(first date, last date)
+returns integer language plpgsql as $$
+declare
+    month date := date_trunc('month', first)::date;
+    next date;
+    suffix text;
+    created integer := 0;
+begin
+    while month <= last loop
+        next := (month + interval '1 month')::date;
+        suffix := to_char(month, '_yyyy_mm');
+        if to_regclass('order' || suffix) is null then
+            execute format('create table %I (like "order" including defaults including constraints)', 'order' || suffix);
+            execute format('create table %I (like ticket including defaults including constraints)', 'ticket' || suffix);
+            execute format(
+                'create trigger order_trigger before insert on %I for each row execute procedure order_function()',
+                'order' || suffix
+            );
+            -- 先移出 ticket，再移出其引用的 order
+            execute format(
+                'insert into %I select * from ticket_default where depart_date >= %L and depart_date < %L',
+                'ticket' || suffix, month, next
+            );
+            execute format(
+                'insert into %I select * from order_default where depart_date >= %L and depart_date < %L',
+                'order' || suffix, month, next
+            );
+            delete from ticket_default where depart_date >= month and depart_date < next;
+            delete from order_default where depart_date >= month and depart_date < next;
+            execute format('alter table "order" attach partition %I for values from (%L) to (%L)', 'order' || suffix, month, next);
+            execute format('alter table ticket attach partition %I for values from (%L) to (%L)', 'ticket' || suffix, month, next);
+            created := created + 1;
+        end if;
+        month := next;
+    end loop;
+    return created;
+end;
+$$;
+
+alter table ticket rename to ticket_unpartitioned;
+alter table "order" rename to order_unpartitioned;
+alter index tickets_pkey rename to tickets_unpartitioned_pkey;
+alter index orders_pkey rename to orders_unpartitioned_pkey;
+alter index if exists order_status_create_date_index rename to order_unpartitioned_status_create_date_index;
+alter sequence ticket_id_seq owned by none;
+alter sequence order_id_seq owned by none;
+
+-- 分区表的主键必须包含分区键；ORM 中仍以 id 为主键
+create table "order" (
+    id integer default nextval('order_id_seq') not null,
+    status integer not null,
+    price double precision not null,
+    user_id integer not null constraint orders_person_fkey references "user",
+    create_date timestamp default (CURRENT_TIMESTAMP + '08:00:00'::interval) not null,
+    depart_journey integer not null constraint order_journey_id_fk references journey,
+    arrive_journey integer not null constraint order_journey_id_fk_2 references journey,
+    carriage_index integer not null,
+    seat_num integer not null,
+    depart_date date not null,
+    train_number varchar(20) not null,
+    constraint orders_pkey primary key (id, depart_date)
+) partition by range (depart_date);
+create index order_status_create_date_index on "order" (status, create_date);
+create index order_train_number_depart_date_index on "order" (train_number, depart_date, carriage_index);
+create table order_default partition of "order" default;
+alter sequence order_id_seq owned by "order".id;
+
+create trigger order_trigger
+before insert on order_default
+for each row
+    execute procedure order_function();
+
+-- 车票与订单的出发日期相同，外键带上分区键
+create table ticket (
+    id integer default nextval('ticket_id_seq') not null,
+    order_id integer not null,
+    carriage_index integer not null,
+    depart_journey integer not null constraint tickets_journeys_fkey1 references journey,
+    arrive_journey integer not null constraint tickets_journeys_fkey2 references journey,
+    depart_date date not null,
+    seat_num integer not null,
+    train_number varchar(20) not null,
+    is_print boolean default false,
+    constraint tickets_pkey primary key (id, depart_date),
+    constraint tickets_orders_fkey foreign key (order_id, depart_date) references "order" (id, depart_date)
+) partition by range (depart_date);
+create index ticket_train_number_depart_date_index on ticket (train_number, depart_date, carriage_index);
+create table ticket_default partition of ticket default;
+alter sequence ticket_id_seq owned by ticket.id;
+
+-- 已有数据最早的月份至预售期（120 天）之后
+select create_partitions(
+    least((select min(depart_date) from order_unpartitioned), current_date), current_date + 120
+);
+insert into "order" select * from order_unpartitioned;
+insert into ticket select * from ticket_unpartitioned;
+drop table ticket_unpartitioned;
+drop table order_unpartitioned;
+
+commit;
+
+analyze "order";
+analyze ticket;
@@ -0,0 +1,4 @@
+-- 加宽 admin、user 的 password 列，容纳 scrypt 等更长的哈希（与 config.password_length 一致）
+-- 在此之前创建的数据库执行一次，可重复执行；只增加 varchar 长度不重写表
+alter table admin alter column password type varchar(255);
+alter table "user" alter column password type varchar(255);
@@ -0,0 +1,29 @@
+-- 车站对 -> 直达车次（journey 的派生表），在 main.sql 及数据导入之后执行，也可用于全量重建
+-- 建表语句同 main.sql，兼容此前没有该表的数据库
+-- 之后由 add.trains、delete.train、delete.station 按车次增量刷新
+begin;
+
+create table if not exists station_pair (
+    from_station_id integer not null,
+    to_station_id integer not null,
+    train_number varchar(20) not null,
+    from_index integer not null,
+    to_index integer not null,
+    constraint station_pair_pkey primary key (from_station_id, to_station_id, train_number)
+);
+create index if not exists station_pair_train_number_index on station_pair (train_number);
+
+-- 环线列车同一车站可能出现多次，取最早上车、最晚下车；没有任何时刻的停靠站不能上下车（与时刻表索引一致）
+truncate station_pair;
+insert into station_pair (from_station_id, to_station_id, train_number, from_index, to_index)
+select a.station_id, b.station_id, a.train_number, min(a.station_index), max(b.station_index)
+from journey as a join journey as b
+    on b.train_number = a.train_number and b.station_index > a.station_index
+where a.is_valid and b.is_valid
+    and (a.arrive_time is not null or a.depart_time is not null)
+    and (b.arrive_time is not null or b.depart_time is not null)
+group by a.station_id, b.station_id, a.train_number;
+
+commit;
+
+analyze station_pair;